@@ -1,3 +1,16 @@
 from .exceptions import VariableAssignmentError
+from .graph import Graph, default_graph
+from .context import EvaluationContext
 from .basic_expressions import Argument, Variable, Expression
-from .global_funcs import d, assign, value, exp, ln, log, logistic
+from .global_funcs import d, grad, assign, reassign, value, exp, ln, log, logistic, softplus, log_logistic, \
+    binary_cross_entropy_with_logits, logsumexp, softmax, sum, mean, dot
+from .tensor_expressions import TensorExpression, TensorVariable
+from .forward_mode import jvp, forward_grad
+from .compiler import compile
+from .simplify import simplify
+from .fusion import fuse
+from .symbolic import symbolic_grad, derivative
+from .flat_graph import FlatGraph
+from .vectorized import BatchEvaluator, batch_value, batch_grad
+from .binding import Binding
+from .parallel import ParallelGradient
@@ -1,8 +1,35 @@
-from .basic_expressions import Expression, Argument
+from typing import Any, Sequence
+import numpy as np
+from .basic_expressions import Expression, Argument, ExponentialExpression, LogExpression, _make_sum
+from . import opcodes
 import math
 
 
+def _softplus(x: float) -> float:
+    # ln(1 + exp(x)) without overflowing for large x
+    return max(x, 0) + math.log1p(math.exp(-abs(x)))
+
+
+def _stable_logistic(x: float) -> float:
+    # 1 / (1 + exp(-x)) without overflowing for large negative x
+    return 0.5 + 0.5 * math.tanh(x / 2)
+
+
+def _logsumexp(*xs: Any) -> Any:
+    # ln(sum(exp(x))) shifted by the largest x so that nothing overflows. Works on numbers or numpy columns
+    if any(isinstance(x, np.ndarray) for x in xs):
+        xs = np.broadcast_arrays(*xs)
+        shift = np.maximum.reduce(xs)
+        return shift + np.log(np.add.reduce([np.exp(x - shift) for x in xs]))
+    shift = max(xs)
+    if math.isinf(shift):
+        return shift
+    return shift + math.log(math.fsum(math.exp(x - shift) for x in xs))
+
+
 class LogisticExpression(Expression):
+    __slots__ = ()
+    _opcode = opcodes.LOGISTIC
     arg = Argument()
 
     def _get_value(self):
@@ -14,3 +41,269 @@ class LogisticExpression(Expression):
 
     def _make_str(self):
         return f"logistic({self.arg._str})"
+
+    def _code(self, gen, arg) -> str:
+        return f'1 / (1 + math.exp(-{arg}))'
+
+    def _deriv_code(self, gen, out, arg) -> list[str]:
+        return [f'{out} * (1 - {out})']
+
+    def _build(self, arg):
+        return LogisticExpression(arg) if isinstance(arg, Expression) else 1 / (1 + math.exp(-arg))
+
+    def _deriv_exps(self) -> list:
+        return [self * (1 - self)]
+
+
+class SoftplusExpression(Expression):
+    """
+    ln(1 + exp(x)), evaluated without overflowing for large x
+    """
+
+    __slots__ = ()
+    _opcode = opcodes.SOFTPLUS
+    arg = Argument()
+
+    def _get_value(self):
+        return _softplus(self.arg.val)
+
+    @arg.derivative
+    def derivative(self):
+        # The logistic of x, which is 1 - exp(-softplus(x))
+        return -math.expm1(-self.val)
+
+    def _make_str(self):
+        return f"softplus({self.arg._str})"
+
+    def _code(self, gen, arg) -> str:
+        # max is written with abs so the template also works elementwise with numpy
+        return f'({arg} + abs({arg})) / 2 + math.log1p(math.exp(-abs({arg})))'
+
+    def _deriv_code(self, gen, out, arg) -> list[str]:
+        return [f'-math.expm1(-{out})']
+
+    def _build(self, arg):
+        return SoftplusExpression(arg) if isinstance(arg, Expression) else _softplus(arg)
+
+    def _deriv_exps(self) -> list:
+        return [LogisticExpression(self.arg)]
+
+
+class LogLogisticExpression(Expression):
+    """
+    ln(logistic(x)), which is -softplus(-x), evaluated without overflowing
+    """
+
+    __slots__ = ()
+    _opcode = opcodes.LOG_LOGISTIC
+    arg = Argument()
+
+    def _get_value(self):
+        return -_softplus(-self.arg.val)
+
+    @arg.derivative
+    def derivative(self):
+        # logistic(-x), which is 1 - exp(ln(logistic(x)))
+        return -math.expm1(self.val)
+
+    def _make_str(self):
+        return f"log_logistic({self.arg._str})"
+
+    def _code(self, gen, arg) -> str:
+        return f'({arg} - abs({arg})) / 2 - math.log1p(math.exp(-abs({arg})))'
+
+    def _deriv_code(self, gen, out, arg) -> list[str]:
+        return [f'-math.expm1({out})']
+
+    def _build(self, arg):
+        return LogLogisticExpression(arg) if isinstance(arg, Expression) else -_softplus(-arg)
+
+    def _deriv_exps(self) -> list:
+        return [LogisticExpression(-self.arg)]
+
+
+class BinaryCrossEntropyExpression(Expression):
+    """
+    Negative log likelihood of a target in [0, 1] under logistic(logit), which is softplus(logit) - target * logit
+    The gradient wrt the logit is logistic(logit) - target
+    """
+
+    __slots__ = ()
+    _opcode = opcodes.BINARY_CROSS_ENTROPY
+    logit = Argument()
+    target = Argument()
+
+    def _get_value(self):
+        logit = self.logit.val
+        return _softplus(logit) - self.target.val * logit
+
+    @logit.derivative
+    def logit_deriv(self):
+        return _stable_logistic(self.logit.val) - self.target.val
+
+    @target.derivative
+    def target_deriv(self):
+        return -self.logit.val
+
+    def _make_str(self):
+        return f"binary_cross_entropy({self.logit._str}, {self.target._str})"
+
+    def _code(self, gen, logit, target) -> str:
+        return f'({logit} + abs({logit})) / 2 + math.log1p(math.exp(-abs({logit}))) - {target} * {logit}'
+
+    def _deriv_code(self, gen, out, logit, target) -> list[str]:
+        # The tanh form of the logistic does not overflow with either math or numpy
+        return [f'0.5 + 0.5 * math.tanh({logit} / 2) - {target}', f'-{logit}']
+
+    def _build(self, logit, target):
+        if not isinstance(logit, Expression):
+            return _softplus(logit) - target * logit
+        if not isinstance(target, Expression):
+            return ConstantTargetBinaryCrossEntropyExpression(logit, target)
+        return BinaryCrossEntropyExpression(logit, target)
+
+    def _deriv_exps(self) -> list:
+        return [LogisticExpression(self.logit) - self.target, -self.logit]
+
+
+class ConstantTargetBinaryCrossEntropyExpression(Expression):
+    """
+    Binary cross entropy of a logit against a constant target
+    """
+
+    __slots__ = ('_target',)
+    _opcode = opcodes.CONST_BINARY_CROSS_ENTROPY
+    logit = Argument()
+
+    def __init__(self, logit: Expression, target: Any):
+        super().__init__(logit)
+        self._target = target
+
+    def _get_value(self):
+        logit = self.logit.val
+        return _softplus(logit) - self._target * logit
+
+    @logit.derivative
+    def derivative(self):
+        return _stable_logistic(self.logit.val) - self._target
+
+    def _make_str(self):
+        return f"binary_cross_entropy({self.logit._str}, {self._target})"
+
+    def _code(self, gen, logit) -> str:
+        target = gen.const(self._target)
+        return f'({logit} + abs({logit})) / 2 + math.log1p(math.exp(-abs({logit}))) - {target} * {logit}'
+
+    def _deriv_code(self, gen, out, logit) -> list[str]:
+        return [f'0.5 + 0.5 * math.tanh({logit} / 2) - {gen.const(self._target)}']
+
+    def _opcode_const(self) -> float:
+        return self._target
+
+    def _build(self, logit):
+        if not isinstance(logit, Expression):
+            return _softplus(logit) - self._target * logit
+        return ConstantTargetBinaryCrossEntropyExpression(logit, self._target)
+
+    def _deriv_exps(self) -> list:
+        return [LogisticExpression(self.logit) - self._target]
+
+
+class LogSumExpExpression(Expression):
+    """
+    ln(exp(x_1) + ... + exp(x_n)) held in a single node, computed with the largest term shifted out
+    The partial wrt each term is its softmax weight exp(x_i - logsumexp), so backprop is O(n)
+    """
+
+    __slots__ = ()
+    _opcode = opcodes.LOGSUMEXP
+
+    def _get_value(self):
+        return _logsumexp(*(term.val for term in self._subexps))
+
+    def _deriv(self, numer: Expression) -> None:
+        adjoint = self._d[numer]
+        total = self.val
+        for term in self._subexps:
+            term._d[numer] += adjoint * math.exp(term.val - total)
+
+    def _local_deriv(self, idx: int):
+        return math.exp(self._subexps[idx].val - self.val)
+
+    def _make_str(self):
+        return f"logsumexp({', '.join(term._str for term in self._subexps)})"
+
+    def _code(self, gen, *terms) -> str:
+        return f"{gen.const(_logsumexp)}({', '.join(terms)})"
+
+    def _deriv_code(self, gen, out, *terms) -> list[str]:
+        return [f'math.exp({term} - {out})' for term in terms]
+
+    def _build(self, *terms):
+        if all(isinstance(term, Expression) for term in terms):
+            return LogSumExpExpression(*terms)
+        if not any(isinstance(term, Expression) for term in terms):
+            return _logsumexp(*terms)
+        return LogExpression(_make_sum([ExponentialExpression(term) if isinstance(term, Expression) else math.exp(term)
+                                        for term in terms], 0))
+
+    def _deriv_exps(self) -> list:
+        return [ExponentialExpression(term - self) for term in self._subexps]
+
+
+class LinearCombinationExpression(Expression):
+    """
+    Dot product of a sequence of weights with a sequence of inputs held in a single node
+    The subexpressions are all the weights followed by all the inputs
+    """
+
+    __slots__ = ('_n',)
+    _opcode = opcodes.LINEAR_COMBINATION
+
+    def __init__(self, weights: Sequence[Expression], inputs: Sequence[Expression]):
+        if len(weights) != len(inputs):
+            raise ValueError(f'Got {len(weights)} weights but {len(inputs)} inputs')
+        super().__init__(*weights, *inputs)
+        self._n = len(weights)
+
+    @property
+    def weights(self) -> tuple[Expression, ...]:
+        return self._subexps[:self._n]
+
+    @property
+    def inputs(self) -> tuple[Expression, ...]:
+        return self._subexps[self._n:]
+
+    def _get_value(self):
+        total = 0
+        for weight, inp in zip(self.weights, self.inputs):
+            total += weight.val * inp.val
+        return total
+
+    def _deriv(self, numer: Expression) -> None:
+        adjoint = self._d[numer]
+        for weight, inp in zip(self.weights, self.inputs):
+            weight._d[numer] += adjoint * inp.val
+            inp._d[numer] += adjoint * weight.val
+
+    def _local_deriv(self, idx: int):
+        return self._subexps[idx + self._n].val if idx < self._n else self._subexps[idx - self._n].val
+
+    def _make_str(self):
+        terms = [f'{weight._str} * {inp._str}' for weight, inp in zip(self.weights, self.inputs)]
+        return f"({' + '.join(terms)})"
+
+    def _code(self, gen, *args) -> str:
+        return ' + '.join(f'{weight} * {inp}' for weight, inp in zip(args[:self._n], args[self._n:]))
+
+    def _deriv_code(self, gen, out, *args) -> list[str]:
+        return [*args[self._n:], *args[:self._n]]
+
+    def _build(self, *args):
+        weights, inputs = args[:self._n], args[self._n:]
+        if all(isinstance(arg, Expression) for arg in args):
+            return LinearCombinationExpression(weights, inputs)
+        return _make_sum([weight * inp for weight, inp in zip(weights, inputs)], 0)
+
+    def _deriv_exps(self) -> list:
+        return [*self.inputs, *self.weights]
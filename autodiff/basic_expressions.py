@@ -1,87 +1,168 @@
 from typing import Optional, Any, Union
-from abc import ABC, abstractmethod
+from abc import ABC, ABCMeta, abstractmethod
 from collections import Counter, defaultdict
 import inspect
 import math
+import numpy as np
 from .exceptions import VariableAssignmentError
+from .graph import Graph
+from .context import EvaluationContext
+from . import opcodes
 
 
 class Argument:
     def __init__(self):
         self._deriv = None
+        self._vjp = None
         self._pos: Optional[int] = None
 
     def derivative(self, func):
         self._deriv = func
         return func
 
+    def vjp(self, func):
+        # For tensor expressions whose derivative is not elementwise, func(self, grad) maps the gradient of self to the
+        # gradient of the argument
+        self._vjp = func
+        return func
+
     def __get__(self, instance: 'Expression', owner=None):
         return instance._subexps[self._pos]
 
 
-class Expression(ABC):
+def _intern_key(arg: Any) -> Any:
+    # Subexpressions are compared by identity and constants by type and value
+    if isinstance(arg, Expression):
+        return arg
+    if isinstance(arg, (list, tuple)):
+        return tuple(map(_intern_key, arg))
+    if isinstance(arg, float):
+        # -0.0 equals 0.0 but can change results through its sign, and nan never equals itself
+        return type(arg), 'nan' if math.isnan(arg) else (arg, math.copysign(1., arg))
+    hash(arg)
+    return type(arg), arg
+
+
+def _find_graph(args: tuple) -> Optional[Graph]:
+    for arg in args:
+        if isinstance(arg, Expression):
+            return arg._graph
+        if isinstance(arg, (list, tuple)):
+            graph = _find_graph(arg)
+            if graph is not None:
+                return graph
+    return None
+
+
+class ExpressionMeta(ABCMeta):
+    """
+    Makes constructing a node in a graph with interning on return the existing node with the same type, subexpressions
+    and constants, if there is one
+    """
+
+    def __call__(cls, *args, **kwargs):
+        graph = _find_graph(args)
+        if graph is None or graph._interned is None:
+            return super().__call__(*args, **kwargs)
+        try:
+            key = cls, _intern_key(args), _intern_key(tuple(sorted(kwargs.items())))
+        except TypeError:  # Unhashable constants, such as arrays
+            return super().__call__(*args, **kwargs)
+        node = graph._interned.get(key)
+        if node is None:
+            node = graph._interned[key] = super().__call__(*args, **kwargs)
+        return node
+
+
+class Expression(ABC, metaclass=ExpressionMeta):
+    __slots__ = ('_graph', '_id', '_subexps', '__cached_str', '__cached_order', '__weakref__')
     _derivs: list
+    _vjps: list
 
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
         cls._derivs = []
+        cls._vjps = []
         for pos, (name, argobj) in enumerate(inspect.getmembers(cls, lambda x: isinstance(x, Argument))):
             argobj._pos = pos
             cls._derivs.append(argobj._deriv)
-
-    def __init__(self, *subexps: 'Expression'):
+            cls._vjps.append(argobj._vjp)
+
+    def __init__(self, *subexps: 'Expression', graph: Optional[Graph] = None):
+        if subexps:
+            graph = subexps[0]._graph
+            if any(exp._graph is not graph for exp in subexps):
+                raise ValueError('Cannot combine expressions from different graphs')
+        elif graph is None:
+            graph = Graph.current()
+        self._graph = graph
+        self._id = graph._add_node(self)
         self._subexps = subexps
-        self._var_deps: set[Variable] = set()
-        for exp in subexps:
-            if isinstance(exp, Variable):
-                exp._add_dependent_expression(self)
-                self._var_deps.add(exp)
-            else:
-                self._var_deps.update(exp._var_deps)
-                for var in exp._var_deps:
-                    var._add_dependent_expression(self)
-        self._val = None
-        self._d: Counter['Expression', Any] = Counter()
         self.__cached_str: Optional[str] = None
+        self.__cached_order: Optional[list['Expression']] = None
+
+    # Tensor expressions set this, so that arithmetic mixing scalar and tensor expressions builds tensor nodes
+    _is_tensor = False
+    # Kind of node in a FlatGraph, or None if the node can't be flattened
+    _opcode: Optional[int] = None
+
+    def _defers_to(self, other: Any) -> bool:
+        return isinstance(other, Expression) and other._is_tensor and not self._is_tensor
 
     def __add__(self, other: Any) -> Union['AdditionExpression', 'ConstantAdditionExpression']:
+        if self._defers_to(other):
+            return NotImplemented
         return AdditionExpression(self, other) if isinstance(other, Expression) else ConstantAdditionExpression(self, other)
 
     __radd__ = __add__
 
     def __mul__(self, other: Any) -> Union['MultiplicationExpression', 'ConstantMultiplicationExpression']:
+        if self._defers_to(other):
+            return NotImplemented
         return MultiplicationExpression(self, other) if isinstance(other, Expression) else ConstantMultiplicationExpression(self, other)
 
     __rmul__ = __mul__
 
-    def __pow__(self, power, modulo=None) -> Union['PowerExpression', 'ExponentialExpression']:
+    def __pow__(self, power, modulo=None) -> Union['PowerExpression', 'BinaryPowerExpression']:
         if modulo is not None:
             raise NotImplementedError('Modular exponentiation is not implemented')
-        return ExponentialExpression(LogExpression(self) * power) if isinstance(power, Expression) else PowerExpression(self, power)
+        if self._defers_to(power):
+            return NotImplemented
+        return BinaryPowerExpression(self, power) if isinstance(power, Expression) else PowerExpression(self, power)
 
     def __rpow__(self, other):
         return ExponentialExpression(math.log(other) * self)
 
-    def __sub__(self, other) -> Union['AdditionExpression', 'ConstantAdditionExpression']:
-        return self + -1 * other
+    def __sub__(self, other) -> Union['SubtractionExpression', 'ConstantSubtractionExpression']:
+        if self._defers_to(other):
+            return NotImplemented
+        return SubtractionExpression(self, other) if isinstance(other, Expression) else ConstantSubtractionExpression(self, other)
+
+    def __rsub__(self, other) -> 'ReverseConstantSubtractionExpression':
+        return ReverseConstantSubtractionExpression(self, other)
 
-    def __rsub__(self, other) -> Union['AdditionExpression', 'ConstantAdditionExpression']:
-        return other + -1 * self
+    def __truediv__(self, other) -> Union['DivisionExpression', 'ConstantDivisionExpression']:
+        if self._defers_to(other):
+            return NotImplemented
+        return DivisionExpression(self, other) if isinstance(other, Expression) else ConstantDivisionExpression(self, other)
 
-    def __truediv__(self, other) -> Union['MultiplicationExpression', 'ConstantMultiplicationExpression']:
-        return self * other ** -1
+    def __rtruediv__(self, other) -> 'ReverseConstantDivisionExpression':
+        return ReverseConstantDivisionExpression(self, other)
 
-    def __rtruediv__(self, other) -> Union['MultiplicationExpression', 'ConstantMultiplicationExpression']:
-        return other * self ** -1
+    def __neg__(self) -> 'NegationExpression':
+        return NegationExpression(self)
 
-    def __neg__(self):
-        return -1 * self
+    @property
+    def _ctx(self) -> EvaluationContext:
+        # The evaluation state for this node's graph in the current thread
+        return EvaluationContext.current(self._graph)
 
     @property
     def val(self):
-        if self._val is None:
-            self._val = self._get_value()
-        return self._val
+        ctx = EvaluationContext.current(self._graph)
+        if self._id >= len(ctx.verified_at) or ctx.verified_at[self._id] != ctx.epoch:
+            self._evaluate(ctx)
+        return ctx.values[self._id]
 
     @val.setter
     def val(self, v):
@@ -91,17 +172,74 @@ class Expression(ABC):
         raise NotImplementedError('This expression does not allow value assignment')
 
     def unset(self):
-        self._val = None
-        self._d = Counter()
+        self._ctx.clear(self._id)
+
+    @property
+    def _d(self) -> Counter['Expression', Any]:
+        # Derivatives of each numerator wrt self, made lazily
+        return self._ctx.adjoint_counter(self._id)
 
     @abstractmethod
     def _get_value(self):
         pass
 
+    def _evaluate(self, ctx: Optional[EvaluationContext] = None) -> None:
+        # Verify self and all its dependencies bottom up, only recomputing nodes with a changed subexpression
+        # An explicit stack is used instead of recursion so that deep graphs don't hit the recursion limit
+        ctx = self._ctx if ctx is None else ctx
+        ctx.reserve()
+        epoch = ctx.epoch
+        values, verified_at, changed_at = ctx.values, ctx.verified_at, ctx.changed_at
+        stack = [self]
+        while stack:
+            curr = stack[-1]
+            curr_id = curr._id
+            if verified_at[curr_id] == epoch:
+                stack.pop()
+                continue
+            pending = [exp for exp in curr._subexps if verified_at[exp._id] != epoch]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            if not curr._subexps:
+                # Leaves (variables) record their own changes when they are assigned
+                values[curr_id] = curr._get_value()
+            elif verified_at[curr_id] < 0 or any(changed_at[exp._id] > verified_at[curr_id] for exp in curr._subexps):
+                values[curr_id] = curr._get_value()
+                changed_at[curr_id] = epoch
+            verified_at[curr_id] = epoch
+
     def _backprop(self) -> None:
-        if self in self._d:  # There was already a backprop from this point
+        # Evaluate the whole graph first so the derivative rules only read cached values
+        ctx = self._ctx
+        self._evaluate(ctx)
+
+        # Nothing under self changed since the last backprop from this point
+        if ctx.backprop_at[self._id] >= ctx.changed_at[self._id]:
             return
 
+        # Clear the derivs left by the last backprop from this point
+        order = self._topo_order
+        for exp in order:
+            exp._d[self] = 0
+
+        # Deriv of self wrt self is 1
+        self._d[self] = self._unit_adjoint()
+
+        # Loop through topo sorted deps and find derivs
+        for exp in order:
+            exp._deriv(self)
+        ctx.backprop_at[self._id] = ctx.epoch
+
+    @property
+    def _topo_order(self) -> list['Expression']:
+        # The subexpressions of a node never change after construction, so the order is valid for the node's lifetime
+        if self.__cached_order is None:
+            self.__cached_order = self._make_topo_order()
+        return self.__cached_order
+
+    def _make_topo_order(self) -> list['Expression']:
         # Topo sort of all dependencies of self
         # Make the incoming list using DFS
         incoming = defaultdict(set)
@@ -121,21 +259,40 @@ class Expression(ABC):
         while free_nodes:
             curr_node = free_nodes.pop()
             order.append(curr_node)
-            for nbr in curr_node._subexps:
+            # A node using the same child twice must only free it once
+            for nbr in dict.fromkeys(curr_node._subexps):
                 incoming[nbr].discard(curr_node)
                 if not incoming[nbr]:
                     free_nodes.append(nbr)
+        return order
 
-        # Deriv of self wrt self is 1
-        self._d[self] = 1
-
-        # Loop through topo sorted deps and find derivs
-        for exp in order:
-            exp._deriv(self)
+    def _unit_adjoint(self):
+        return 1
 
     def _deriv(self, numer: 'Expression') -> None:
-        for idx, expr in enumerate(self._subexps):
-            expr._d[numer] += self._d[numer] * self._derivs[idx](self)
+        adjoint = self._d[numer]
+        for expr, partial in zip(self._subexps, self._local_derivs()):
+            expr._d[numer] += adjoint * partial
+
+    def _local_derivs(self) -> list:
+        # Derivs of self wrt each subexpression, reused until the value of self is recomputed
+        ctx = self._ctx
+        changed_at = ctx.changed_at[self._id]
+        if ctx.partials_at[self._id] != changed_at:
+            ctx.partials[self._id] = [self._local_deriv(idx) for idx in range(len(self._subexps))]
+            ctx.partials_at[self._id] = changed_at
+        return ctx.partials[self._id]
+
+    def _local_deriv(self, idx: int):
+        # Derivative of self wrt its subexpression at position idx
+        return self._derivs[idx](self)
+
+    def __getstate__(self) -> tuple[Optional[dict], dict]:
+        # The cached order can be as deep as the graph, so it is rebuilt after unpickling instead of being pickled
+        state, slots = super().__getstate__()
+        slots['_Expression__cached_str'] = None
+        slots['_Expression__cached_order'] = None
+        return state, slots
 
     @property
     def _str(self):
@@ -144,53 +301,132 @@ class Expression(ABC):
         return self.__cached_str
 
     def __str__(self) -> str:
-        return f'{self._str}={self._val}'
+        ctx = self._ctx
+        current = self._id < len(ctx.verified_at) and ctx.verified_at[self._id] == ctx.epoch
+        return f'{self._str}={ctx.values[self._id] if current else None}'
 
     @abstractmethod
     def _make_str(self) -> str:
         pass
 
+    def _code(self, gen: 'CodeGen', *args: str) -> str:
+        # Python source for the value of self, given the names holding the values of the subexpressions
+        raise NotImplementedError(f'{type(self).__name__} cannot be compiled')
+
+    def _deriv_code(self, gen: 'CodeGen', out: str, *args: str) -> list[str]:
+        # Python source for the derivative of self wrt each subexpression, given the name holding the value of self
+        raise NotImplementedError(f'{type(self).__name__} cannot be compiled')
+
+    def _opcode_const(self) -> float:
+        # Constant stored alongside the opcode of self in a FlatGraph
+        return 0.
+
+    def _rebuild(self, *subexps: Any) -> Any:
+        # A node like self with the given subexpressions, any of which may have been folded into a constant
+        if all(new is old for new, old in zip(subexps, self._subexps)):
+            return self
+        return self._build(*subexps)
+
+    def _build(self, *subexps: Any) -> Any:
+        # A new node like self with the given subexpressions
+        # Nodes built from just their arguments, like most custom nodes, are remade with the same constructor. Any other
+        # node is kept as it is, which is still equivalent, and whole graph passes just don't rewrite below it
+        if type(self).__init__ is Expression.__init__ and all(isinstance(sub, Expression) for sub in subexps):
+            return type(self)(*subexps)
+        return self
+
+    def _simplify(self, *subexps: Any) -> Any:
+        # A simpler equivalent of self, given its already simplified subexpressions
+        return self._rebuild(*subexps)
+
+    def _deriv_exps(self) -> list:
+        # Derivatives of self wrt each subexpression as expressions or numbers, for building derivative graphs
+        raise NotImplementedError(f'{type(self).__name__} has no symbolic derivative. Give it a _deriv_exps method '
+                                  f'returning its derivative wrt each argument as an expression or number')
+
+
+def _is_const(value: Any, target: Any) -> bool:
+    return isinstance(value, (int, float)) and value == target
+
+
+def _make_sum(terms: Any, const: Any) -> Any:
+    # A SumExpression of the expressions in terms, with the constants folded into const
+    exps = []
+    for term in terms:
+        if isinstance(term, Expression):
+            exps.append(term)
+        else:
+            const += term
+    return SumExpression(*exps, const_term=const) if exps else const
+
+
+def _same_value(old: Any, new: Any) -> bool:
+    # Arrays can be changed in place and assigned again, so an array is never known to be unchanged
+    if type(old) is not type(new) or isinstance(new, np.ndarray):
+        return False
+    # -0.0 == 0.0, but the sign can change results
+    if isinstance(new, float):
+        return old == new and math.copysign(1., old) == math.copysign(1., new)
+    try:
+        return bool(old == new)
+    except ValueError:  # Comparing other array-likes elementwise
+        return False
+
 
 class Variable(Expression):
-    _by_name: dict[str, 'Variable'] = {}
+    __slots__ = ('_name',)
+    _opcode = opcodes.VARIABLE
 
     @classmethod
     def get_by_name(cls, name: str) -> 'Variable':
-        if name not in cls._by_name:
-            raise KeyError(f'No Variable called {name} exists')
-        return cls._by_name[name]
-
-    def __init__(self, name: str):
-        super().__init__()
-        if name in self._by_name:
-            raise ValueError(f'Variable with name {name} already exists')
-        self._by_name[name] = self
-        self._dependent_exps: set[Expression] = set()
+        return Graph.current().get_by_name(name)
+
+    def __init__(self, name: str, graph: Optional[Graph] = None):
+        graph = Graph.current() if graph is None else graph
+        graph._add_variable(self, name)
+        super().__init__(graph=graph)
         self._name = name
-        self._assigned = False
-        self._val = None
+
+    @property
+    def _assigned(self) -> bool:
+        ctx = self._ctx
+        return self._id < len(ctx.assigned) and ctx.assigned[self._id]
 
     def set(self, v):
-        if self._assigned:
+        ctx = self._ctx
+        ctx.reserve()
+        if ctx.assigned[self._id]:
             raise VariableAssignmentError(f'Variable {self._name} is already assigned')
-        self._assigned = True
-        self._val = v
+        ctx.assigned[self._id] = True
+        self._store(ctx, v)
 
-    def unset(self):
+    def update(self, v):
+        """
+        Changes the value of an assigned variable
+        """
         if not self._assigned:
             raise VariableAssignmentError(f'Variable {self._name} is not assigned')
-        self._assigned = False
-        super().unset()
-        for exp in self._dependent_exps:
-            exp.unset()
+        self._store(self._ctx, v)
 
-    def _get_value(self):
-        if not self._assigned:
+    def unset(self):
+        ctx = self._ctx
+        if self._id >= len(ctx.assigned) or not ctx.assigned[self._id]:
             raise VariableAssignmentError(f'Variable {self._name} is not assigned')
-        return self._val
+        ctx.assigned[self._id] = False
+        ctx.invalidate()
 
-    def _add_dependent_expression(self, exp: Expression):
-        self._dependent_exps.add(exp)
+    def _store(self, ctx: EvaluationContext, v):
+        # The last value is kept after unset, so that reassigning the same value does not dirty any dependents
+        ctx.invalidate()
+        if not _same_value(ctx.values[self._id], v):
+            ctx.values[self._id] = v
+            ctx.changed_at[self._id] = ctx.epoch
+
+    def _get_value(self):
+        ctx = self._ctx
+        if self._id >= len(ctx.assigned) or not ctx.assigned[self._id]:
+            raise VariableAssignmentError(f'Variable {self._name} is not assigned')
+        return ctx.values[self._id]
 
     def _deriv(self, numer: 'Expression'):
         pass
@@ -198,8 +434,13 @@ class Variable(Expression):
     def _make_str(self) -> str:
         return self._name
 
+    def _deriv_exps(self) -> list:
+        return []
+
 
 class AdditionExpression(Expression):
+    __slots__ = ()
+    _opcode = opcodes.ADD
     left_term = Argument()
     right_term = Argument()
 
@@ -214,8 +455,87 @@ class AdditionExpression(Expression):
     def _make_str(self) -> str:
         return f'({self.left_term._str} + {self.right_term._str})'
 
+    def _code(self, gen, left, right) -> str:
+        return f'{left} + {right}'
+
+    def _deriv_code(self, gen, out, left, right) -> list[str]:
+        return ['1', '1']
+
+    def _build(self, left, right):
+        return left + right
+
+    def _deriv_exps(self) -> list:
+        return [1, 1]
+
+
+class SumExpression(Expression):
+    """
+    Sum of any number of terms held in a single node
+    """
+
+    __slots__ = ('_const',)
+    _opcode = opcodes.SUM
+
+    def __init__(self, *terms: Expression, const_term: Any = 0):
+        super().__init__(*terms)
+        self._const = const_term
+
+    def _get_value(self):
+        total = self._const
+        for term in self._subexps:
+            total += term.val
+        return total
+
+    def _deriv(self, numer: 'Expression') -> None:
+        adjoint = self._d[numer]
+        for term in self._subexps:
+            term._d[numer] += adjoint
+
+    def _local_deriv(self, idx: int):
+        return 1
+
+    def _make_str(self) -> str:
+        terms = [term._str for term in self._subexps]
+        if self._const:
+            terms.append(str(self._const))
+        return f"({' + '.join(terms)})"
+
+    def _code(self, gen, *terms) -> str:
+        if _is_const(self._const, 0):
+            return ' + '.join(terms)
+        return ' + '.join([*terms, gen.const(self._const)])
+
+    def _deriv_code(self, gen, out, *terms) -> list[str]:
+        return ['1'] * len(terms)
+
+    def _opcode_const(self) -> float:
+        return self._const
+
+    def _build(self, *terms):
+        return _make_sum(terms, self._const)
+
+    def _simplify(self, *terms):
+        # Constant additions are merged into the constant term
+        if any(isinstance(term, ConstantAdditionExpression) for term in terms):
+            const = self._const
+            merged = []
+            for term in terms:
+                if isinstance(term, ConstantAdditionExpression):
+                    const += term._const
+                    term = term.exp_term
+                merged.append(term)
+            return _make_sum(merged, const)
+        if len(terms) == 1 and _is_const(self._const, 0):
+            return terms[0]
+        return self._rebuild(*terms)
+
+    def _deriv_exps(self) -> list:
+        return [1] * len(self._subexps)
+
 
 class ConstantAdditionExpression(Expression):
+    __slots__ = ('_const',)
+    _opcode = opcodes.CONST_ADD
     exp_term = Argument()
 
     def __init__(self, exp_term: Expression, const_term: Any):
@@ -232,8 +552,197 @@ class ConstantAdditionExpression(Expression):
     def _make_str(self) -> str:
         return f'({self.exp_term._str} + {self._const})'
 
+    def _code(self, gen, exp_term) -> str:
+        return f'{exp_term} + {gen.const(self._const)}'
+
+    def _deriv_code(self, gen, out, exp_term) -> list[str]:
+        return ['1']
+
+    def _opcode_const(self) -> float:
+        return self._const
+
+    def _build(self, exp_term):
+        return exp_term + self._const
+
+    def _simplify(self, exp_term):
+        if _is_const(self._const, 0):
+            return exp_term
+        if isinstance(exp_term, ConstantAdditionExpression):
+            return exp_term.exp_term + (exp_term._const + self._const)
+        if isinstance(exp_term, SumExpression):
+            return SumExpression(*exp_term._subexps, const_term=exp_term._const + self._const)
+        return self._rebuild(exp_term)
+
+    def _deriv_exps(self) -> list:
+        return [1]
+
+
+class SubtractionExpression(Expression):
+    __slots__ = ()
+    _opcode = opcodes.SUB
+    minuend = Argument()
+    subtrahend = Argument()
+
+    def _get_value(self):
+        return self.minuend.val - self.subtrahend.val
+
+    @minuend.derivative
+    def minuend_deriv(self):
+        return 1
+
+    @subtrahend.derivative
+    def subtrahend_deriv(self):
+        return -1
+
+    def _make_str(self) -> str:
+        return f'({self.minuend._str} - {self.subtrahend._str})'
+
+    def _code(self, gen, minuend, subtrahend) -> str:
+        return f'{minuend} - {subtrahend}'
+
+    def _deriv_code(self, gen, out, minuend, subtrahend) -> list[str]:
+        return ['1', '-1']
+
+    def _build(self, minuend, subtrahend):
+        return minuend - subtrahend
+
+    def _deriv_exps(self) -> list:
+        return [1, -1]
+
+
+class ConstantSubtractionExpression(Expression):
+    """
+    An expression minus a constant
+    """
+
+    __slots__ = ('_const',)
+    _opcode = opcodes.CONST_SUB
+    minuend = Argument()
+
+    def __init__(self, minuend: Expression, const_subtrahend: Any):
+        super().__init__(minuend)
+        self._const = const_subtrahend
+
+    def _get_value(self):
+        return self.minuend.val - self._const
+
+    @minuend.derivative
+    def deriv(self):
+        return 1
+
+    def _make_str(self) -> str:
+        return f'({self.minuend._str} - {self._const})'
+
+    def _code(self, gen, minuend) -> str:
+        return f'{minuend} - {gen.const(self._const)}'
+
+    def _deriv_code(self, gen, out, minuend) -> list[str]:
+        return ['1']
+
+    def _opcode_const(self) -> float:
+        return self._const
+
+    def _build(self, minuend):
+        return minuend - self._const
+
+    def _simplify(self, minuend):
+        if _is_const(self._const, 0):
+            return minuend
+        # Merge into the constant of an addition
+        if isinstance(minuend, (ConstantAdditionExpression, SumExpression)):
+            return minuend + -self._const
+        return self._rebuild(minuend)
+
+    def _deriv_exps(self) -> list:
+        return [1]
+
+
+class ReverseConstantSubtractionExpression(Expression):
+    """
+    A constant minus an expression
+    """
+
+    __slots__ = ('_const',)
+    _opcode = opcodes.REVERSE_CONST_SUB
+    subtrahend = Argument()
+
+    def __init__(self, subtrahend: Expression, const_minuend: Any):
+        super().__init__(subtrahend)
+        self._const = const_minuend
+
+    def _get_value(self):
+        return self._const - self.subtrahend.val
+
+    @subtrahend.derivative
+    def deriv(self):
+        return -1
+
+    def _make_str(self) -> str:
+        return f'({self._const} - {self.subtrahend._str})'
+
+    def _code(self, gen, subtrahend) -> str:
+        return f'{gen.const(self._const)} - {subtrahend}'
+
+    def _deriv_code(self, gen, out, subtrahend) -> list[str]:
+        return ['-1']
+
+    def _opcode_const(self) -> float:
+        return self._const
+
+    def _build(self, subtrahend):
+        return self._const - subtrahend
+
+    def _simplify(self, subtrahend):
+        if _is_const(self._const, 0):
+            return -subtrahend
+        if isinstance(subtrahend, ReverseConstantSubtractionExpression):
+            return subtrahend.subtrahend + (self._const - subtrahend._const)
+        return self._rebuild(subtrahend)
+
+    def _deriv_exps(self) -> list:
+        return [-1]
+
+
+class NegationExpression(Expression):
+    __slots__ = ()
+    _opcode = opcodes.NEG
+    arg = Argument()
+
+    def _get_value(self):
+        return -self.arg.val
+
+    @arg.derivative
+    def deriv(self):
+        return -1
+
+    def _make_str(self) -> str:
+        return f'(-{self.arg._str})'
+
+    def _code(self, gen, arg) -> str:
+        return f'-{arg}'
+
+    def _deriv_code(self, gen, out, arg) -> list[str]:
+        return ['-1']
+
+    def _build(self, arg):
+        return -arg
+
+    def _simplify(self, arg):
+        if isinstance(arg, NegationExpression):
+            return arg.arg
+        if isinstance(arg, ConstantMultiplicationExpression):
+            return arg.exp_factor * -arg._const
+        if isinstance(arg, ReverseConstantSubtractionExpression):
+            return arg.subtrahend - arg._const
+        return self._rebuild(arg)
+
+    def _deriv_exps(self) -> list:
+        return [-1]
+
 
 class MultiplicationExpression(Expression):
+    __slots__ = ()
+    _opcode = opcodes.MUL
     left_factor = Argument()
     right_factor = Argument()
 
@@ -251,8 +760,22 @@ class MultiplicationExpression(Expression):
     def _make_str(self) -> str:
         return f'({self.left_factor._str} * {self.right_factor._str})'
 
+    def _code(self, gen, left, right) -> str:
+        return f'{left} * {right}'
+
+    def _deriv_code(self, gen, out, left, right) -> list[str]:
+        return [right, left]
+
+    def _build(self, left, right):
+        return left * right
+
+    def _deriv_exps(self) -> list:
+        return [self.right_factor, self.left_factor]
+
 
 class ConstantMultiplicationExpression(Expression):
+    __slots__ = ('_const',)
+    _opcode = opcodes.CONST_MUL
     exp_factor = Argument()
 
     def __init__(self, exp_factor: Expression, const_factor: Any):
@@ -269,8 +792,161 @@ class ConstantMultiplicationExpression(Expression):
     def _make_str(self) -> str:
         return f'({self._const} * {self.exp_factor._str})'
 
+    def _code(self, gen, exp_factor) -> str:
+        return f'{exp_factor} * {gen.const(self._const)}'
+
+    def _deriv_code(self, gen, out, exp_factor) -> list[str]:
+        return [gen.const(self._const)]
+
+    def _opcode_const(self) -> float:
+        return self._const
+
+    def _build(self, exp_factor):
+        return exp_factor * self._const
+
+    def _simplify(self, exp_factor):
+        if _is_const(self._const, 1):
+            return exp_factor
+        # Drops exp_factor, along with its domain errors and infinities, as noted in simplify
+        if _is_const(self._const, 0):
+            return 0
+        if _is_const(self._const, -1):
+            return -exp_factor
+        if isinstance(exp_factor, ConstantMultiplicationExpression):
+            return exp_factor.exp_factor * (exp_factor._const * self._const)
+        return self._rebuild(exp_factor)
+
+    def _deriv_exps(self) -> list:
+        return [self._const]
+
+
+class DivisionExpression(Expression):
+    __slots__ = ()
+    _opcode = opcodes.DIV
+    dividend = Argument()
+    divisor = Argument()
+
+    def _get_value(self):
+        return self.dividend.val / self.divisor.val
+
+    @dividend.derivative
+    def dividend_deriv(self):
+        return 1 / self.divisor.val
+
+    @divisor.derivative
+    def divisor_deriv(self):
+        return -self.val / self.divisor.val
+
+    def _make_str(self) -> str:
+        return f'({self.dividend._str} / {self.divisor._str})'
+
+    def _code(self, gen, dividend, divisor) -> str:
+        return f'{dividend} / {divisor}'
+
+    def _deriv_code(self, gen, out, dividend, divisor) -> list[str]:
+        return [f'1 / {divisor}', f'-{out} / {divisor}']
+
+    def _build(self, dividend, divisor):
+        return dividend / divisor
+
+    def _deriv_exps(self) -> list:
+        return [1 / self.divisor, -self / self.divisor]
+
+
+class ConstantDivisionExpression(Expression):
+    """
+    An expression divided by a constant
+    """
+
+    __slots__ = ('_const',)
+    _opcode = opcodes.CONST_DIV
+    dividend = Argument()
+
+    def __init__(self, dividend: Expression, const_divisor: Any):
+        super().__init__(dividend)
+        self._const = const_divisor
+
+    def _get_value(self):
+        return self.dividend.val / self._const
+
+    @dividend.derivative
+    def derivative(self):
+        return 1 / self._const
+
+    def _make_str(self) -> str:
+        return f'({self.dividend._str} / {self._const})'
+
+    def _code(self, gen, dividend) -> str:
+        return f'{dividend} / {gen.const(self._const)}'
+
+    def _deriv_code(self, gen, out, dividend) -> list[str]:
+        return [f'1 / {gen.const(self._const)}']
+
+    def _opcode_const(self) -> float:
+        return self._const
+
+    def _build(self, dividend):
+        return dividend / self._const
+
+    def _simplify(self, dividend):
+        if _is_const(self._const, 1):
+            return dividend
+        if isinstance(dividend, ConstantDivisionExpression):
+            return dividend.dividend / (dividend._const * self._const)
+        return self._rebuild(dividend)
+
+    def _deriv_exps(self) -> list:
+        return [1 / self._const]
+
+
+class ReverseConstantDivisionExpression(Expression):
+    """
+    A constant divided by an expression
+    """
+
+    __slots__ = ('_const',)
+    _opcode = opcodes.REVERSE_CONST_DIV
+    divisor = Argument()
+
+    def __init__(self, divisor: Expression, const_dividend: Any):
+        super().__init__(divisor)
+        self._const = const_dividend
+
+    def _get_value(self):
+        return self._const / self.divisor.val
+
+    @divisor.derivative
+    def derivative(self):
+        return -self.val / self.divisor.val
+
+    def _make_str(self) -> str:
+        return f'({self._const} / {self.divisor._str})'
+
+    def _code(self, gen, divisor) -> str:
+        return f'{gen.const(self._const)} / {divisor}'
+
+    def _deriv_code(self, gen, out, divisor) -> list[str]:
+        return [f'-{out} / {divisor}']
+
+    def _opcode_const(self) -> float:
+        return self._const
+
+    def _build(self, divisor):
+        return self._const / divisor
+
+    def _simplify(self, divisor):
+        # c / (d / x) is (c / d) * x
+        if isinstance(divisor, ReverseConstantDivisionExpression):
+            return divisor.divisor * (self._const / divisor._const)
+        return self._rebuild(divisor)
+
+    def _deriv_exps(self) -> list:
+        return [-self / self.divisor]
+
 
 class PowerExpression(Expression):
+    __slots__ = ('_pow',)
+    _opcode = opcodes.POW
     base = Argument()
 
     def __init__(self, base: Expression, power: Any):
@@ -287,8 +963,142 @@ class PowerExpression(Expression):
     def _make_str(self) -> str:
         return f'({self.base._str} ** {self._pow})'
 
+    def _code(self, gen, base) -> str:
+        return f'{base} ** {gen.const(self._pow)}'
+
+    def _deriv_code(self, gen, out, base) -> list[str]:
+        power = gen.const(self._pow)
+        return [f'{power} * {base} ** ({power} - 1)']
+
+    def _opcode_const(self) -> float:
+        return self._pow
+
+    def _build(self, base):
+        return base ** self._pow
+
+    def _simplify(self, base):
+        if _is_const(self._pow, 1):
+            return base
+        # Drops base, along with its domain errors, as noted in simplify
+        if _is_const(self._pow, 0):
+            return 1
+        # (x ** a) ** n is x ** (a * n) for whole n, and has the same domain as x ** (a * n) only for whole positive a
+        if (isinstance(base, PowerExpression) and isinstance(self._pow, int)
+                and isinstance(base._pow, int) and base._pow > 0):
+            return base.base ** (base._pow * self._pow)
+        return self._rebuild(base)
+
+    def _deriv_exps(self) -> list:
+        return [self._pow * self.base ** (self._pow - 1)]
+
+
+def _pow(base: Any, exponent: Any) -> Any:
+    # math.pow, or np.power for numpy columns, as np.pow only exists from numpy 2
+    if isinstance(base, np.ndarray) or isinstance(exponent, np.ndarray):
+        return np.power(base, exponent)
+    return math.pow(base, exponent)
+
+
+def _pow_exponent_deriv(val: Any, base: Any) -> Any:
+    # Partial of base ** exponent wrt the exponent given its value: val * ln(base) for a positive base, 0 where the power
+    # is 0 and undefined otherwise. Works on numbers or numpy columns
+    if isinstance(val, np.ndarray) or isinstance(base, np.ndarray):
+        positive = base > 0
+        return np.where(positive, val * np.log(np.where(positive, base, 1.)), np.where(val == 0, 0., np.nan))
+    if base > 0:
+        return val * math.log(base)
+    return 0. if val == 0 else math.nan
+
+
+class BinaryPowerExpression(Expression):
+    """
+    An expression raised to the power of another expression, evaluated directly with **
+    """
+
+    __slots__ = ()
+    _opcode = opcodes.BINARY_POW
+    base = Argument()
+    exponent = Argument()
+
+    def _get_value(self):
+        # math.pow raises for a negative base with a fractional exponent instead of returning a complex number
+        return math.pow(self.base.val, self.exponent.val)
+
+    @base.derivative
+    def base_deriv(self):
+        base = self.base.val
+        exponent = self.exponent.val
+        # Reuse the value of self unless that would divide by zero
+        return exponent * self.val / base if base else exponent * base ** (exponent - 1)
+
+    @exponent.derivative
+    def exponent_deriv(self):
+        # Only the exponent derivative needs the log of the base, which is undefined for negative bases
+        return _pow_exponent_deriv(self.val, self.base.val)
+
+    def _make_str(self) -> str:
+        return f'({self.base._str} ** {self.exponent._str})'
+
+    def _code(self, gen, base, exponent) -> str:
+        # ** would give a complex number where the interpreter raises
+        return f'{gen.const(_pow)}({base}, {exponent})'
+
+    def _deriv_code(self, gen, out, base, exponent) -> list[str]:
+        # The compiled backward pass only emits the log when the exponent needs a gradient
+        return [f'{exponent} * {base} ** ({exponent} - 1)', f'{gen.const(_pow_exponent_deriv)}({out}, {base})']
+
+    def _build(self, base, exponent):
+        return base ** exponent
+
+    def _deriv_exps(self) -> list:
+        return [self.exponent * self.base ** (self.exponent - 1), PowerLogExpression(self.base, self)]
+
+
+class PowerLogExpression(Expression):
+    """
+    power * ln(base), where power is base raised to some exponent. This is the derivative of the power wrt the exponent,
+    so like the numeric one it is 0 where the power is 0 and nan for other non-positive bases instead of raising
+    """
+
+    __slots__ = ()
+    _opcode = opcodes.POW_LOG
+    base = Argument()
+    power = Argument()
+
+    def _get_value(self):
+        return _pow_exponent_deriv(self.power.val, self.base.val)
+
+    @base.derivative
+    def base_deriv(self):
+        return self.power.val / self.base.val
+
+    @power.derivative
+    def power_deriv(self):
+        return math.log(self.base.val)
+
+    def _make_str(self) -> str:
+        return f'({self.power._str} * ln({self.base._str}))'
+
+    def _code(self, gen, base, power) -> str:
+        return f'{gen.const(_pow_exponent_deriv)}({power}, {base})'
+
+    def _deriv_code(self, gen, out, base, power) -> list[str]:
+        return [f'{power} / {base}', f'math.log({base})']
+
+    def _build(self, base, power):
+        if isinstance(base, Expression) and isinstance(power, Expression):
+            return PowerLogExpression(base, power)
+        if isinstance(base, Expression):
+            return power * LogExpression(base)
+        return _pow_exponent_deriv(power, base)
+
+    def _deriv_exps(self) -> list:
+        return [self.power / self.base, LogExpression(self.base)]
+
 
 class ExponentialExpression(Expression):
+    __slots__ = ()
+    _opcode = opcodes.EXP
     exponent = Argument()
 
     def _get_value(self):
@@ -301,8 +1111,27 @@ class ExponentialExpression(Expression):
     def _make_str(self) -> str:
         return f"exp({self.exponent._str})"
 
+    def _code(self, gen, exponent) -> str:
+        return f'math.exp({exponent})'
+
+    def _deriv_code(self, gen, out, exponent) -> list[str]:
+        return [out]
+
+    def _build(self, exponent):
+        return ExponentialExpression(exponent) if isinstance(exponent, Expression) else math.exp(exponent)
+
+    def _simplify(self, exponent):
+        if isinstance(exponent, LogExpression):
+            return exponent.arg
+        return self._rebuild(exponent)
+
+    def _deriv_exps(self) -> list:
+        return [self]
+
 
 class LogExpression(Expression):
+    __slots__ = ()
+    _opcode = opcodes.LOG
     arg = Argument()
 
     def _get_value(self):
@@ -314,3 +1143,20 @@ class LogExpression(Expression):
 
     def _make_str(self) -> str:
         return f"ln({self.arg._str})"
+
+    def _code(self, gen, arg) -> str:
+        return f'math.log({arg})'
+
+    def _deriv_code(self, gen, out, arg) -> list[str]:
+        return [f'1 / {arg}']
+
+    def _build(self, arg):
+        return LogExpression(arg) if isinstance(arg, Expression) else math.log(arg)
+
+    def _simplify(self, arg):
+        if isinstance(arg, ExponentialExpression):
+            return arg.exponent
+        return self._rebuild(arg)
+
+    def _deriv_exps(self) -> list:
+        return [1 / self.arg]
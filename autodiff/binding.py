@@ -0,0 +1,113 @@
+from typing import Iterable, Optional, Union
+import numpy as np
+from .basic_expressions import Variable
+from .context import EvaluationContext
+from .exceptions import VariableAssignmentError
+
+
+class Binding:
+    """
+    A fixed list of scalar variables, resolved once, which can be assigned a whole row of values at a time.
+    Rows are compared against the last row with numpy, and only the variables whose values differ are touched.
+    A binding remembers the last row it stored, so each thread should use its own binding.
+    """
+
+    def __init__(self, variables: Iterable[Union[Variable, str]]):
+        self._vars = [Variable.get_by_name(var) if isinstance(var, str) else var for var in variables]
+        if len(set(self._vars)) != len(self._vars):
+            raise ValueError('A variable can only appear once in a binding')
+        self._ids = [var._id for var in self._vars]
+        graphs = {var._graph for var in self._vars}
+        if len(graphs) > 1:
+            raise ValueError('Cannot bind variables from different graphs')
+        self._graph = graphs.pop() if graphs else None
+        self._values = np.full(len(self._vars), np.nan)
+        self._stored_ctx: Optional[EvaluationContext] = None
+        self._stored_at = -1
+
+    def __len__(self) -> int:
+        return len(self._vars)
+
+    @property
+    def variables(self) -> list[Variable]:
+        return list(self._vars)
+
+    def assign(self, values) -> 'BindingContext':
+        """
+        Context manager which assigns values to the variables in order, and unassigns them on exit
+        """
+        return BindingContext(self, values)
+
+    def update(self, values) -> None:
+        """
+        Changes the values of the variables, which must already be assigned
+        """
+        for var in self._vars:
+            if not var._assigned:
+                raise VariableAssignmentError(f'Variable {var._name} is not assigned')
+        self._store(values)
+
+    def _ctx(self) -> Optional[EvaluationContext]:
+        if self._graph is None:
+            return None
+        ctx = EvaluationContext.current(self._graph)
+        ctx.reserve()
+        return ctx
+
+    def _check(self, values) -> np.ndarray:
+        values = np.asarray(values, dtype=float)
+        if values.shape != self._values.shape:
+            raise ValueError(f'Expected {len(self._vars)} values but got shape {values.shape}')
+        return values
+
+    def _store(self, values) -> None:
+        values = self._check(values)
+        ctx = self._ctx()
+        if ctx is None:
+            return
+
+        # If the row was stored in another context, or anything else assigned one of the variables since, the last row
+        # can't be trusted
+        if ctx is not self._stored_ctx or max(map(ctx.changed_at.__getitem__, self._ids)) > self._stored_at:
+            changed = range(len(self._vars))
+        else:
+            # Signed zeros compare equal, so their signs are compared too
+            changed = np.flatnonzero((values != self._values) | (np.signbit(values) != np.signbit(self._values))).tolist()
+
+        ctx.invalidate()
+        epoch = ctx.epoch
+        row = values.tolist()
+        for idx in changed:
+            node_id = self._ids[idx]
+            ctx.values[node_id] = row[idx]
+            ctx.changed_at[node_id] = epoch
+        self._values[:] = values
+        self._stored_ctx = ctx
+        self._stored_at = epoch
+
+
+class BindingContext:
+    def __init__(self, binding: Binding, values):
+        self._binding = binding
+        self._values = values
+
+    def __enter__(self):
+        # Checked before anything is assigned, as __exit__ won't run if this raises
+        values = self._binding._check(self._values)
+        ctx = self._binding._ctx()
+        if ctx is None:
+            return
+        for var in self._binding._vars:
+            if ctx.assigned[var._id]:
+                raise VariableAssignmentError(f'Variable {var._name} is already assigned')
+        for node_id in self._binding._ids:
+            ctx.assigned[node_id] = True
+        self._binding._store(values)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        ctx = self._binding._ctx()
+        if ctx is None:
+            return
+        for node_id in self._binding._ids:
+            ctx.assigned[node_id] = False
+        ctx.invalidate()
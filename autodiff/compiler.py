@@ -0,0 +1,116 @@
+import builtins
+import math
+from typing import Any, Callable, Iterable, Optional
+from .basic_expressions import Expression, Variable
+
+
+class CodeGen:
+    """
+    Holds the state used while generating the source of a compiled expression
+    """
+
+    def __init__(self, math_module=math):
+        # The templates call math functions through the name math, so an array library can be swapped in
+        self.namespace: dict[str, Any] = {'math': math_module}
+        self._const_names: dict[Any, str] = {}
+
+    def const(self, value: Any) -> str:
+        """
+        Returns a name that the generated code can use to refer to the given constant
+        """
+        # Equal constants share a name, so that code for equal subexpressions is identical
+        try:
+            hash(value)
+            key = type(value), repr(value)
+        except TypeError:
+            key = id(value)
+        if key not in self._const_names:
+            name = f'c{len(self._const_names)}'
+            self._const_names[key] = name
+            self.namespace[name] = value
+        return self._const_names[key]
+
+
+def compile(exp: Expression, inputs: Iterable[Variable], wrt: Optional[Iterable[Expression]] = None) -> Callable:
+    """
+    Compiles exp into a python function of the values of inputs, in the given order.
+    The function returns the value of exp, or if wrt is given, the value and a list of the partials of exp wrt each of wrt.
+    The generated source is available from the source attribute of the returned function.
+    """
+    return _generate(exp, inputs, wrt, math)
+
+
+def _generate(exp: Expression, inputs: Iterable[Variable], wrt: Optional[Iterable[Expression]], math_module) -> Callable:
+    inputs = list(inputs)
+    order = exp._topo_order
+    names = {node: f'v{idx}' for idx, node in enumerate(reversed(order))}
+    gen = CodeGen(math_module)
+
+    positions = {}
+    for idx, var in enumerate(inputs):
+        if not isinstance(var, Variable):
+            raise TypeError(f'Inputs must be variables, got {var._str}')
+        positions[var] = idx
+    lines = [f"def compiled({', '.join(f'x{idx}' for idx in range(len(inputs)))}):"]
+
+    # Forward pass, children before parents
+    # Variables are read straight from the parameters
+    # A node with the same code as an earlier node is the same subexpression built twice, so it reuses the earlier node
+    canon = {}
+    by_code = {}
+    for node in reversed(order):
+        if isinstance(node, Variable):
+            if node not in positions:
+                raise ValueError(f'Expression depends on variable {node._str} which is not an input')
+            names[node] = f'x{positions[node]}'
+            canon[node] = node
+        else:
+            args = [names[sub] for sub in node._subexps]
+            code = node._code(gen, *args)
+            if code in by_code:
+                canon[node] = by_code[code]
+                names[node] = names[canon[node]]
+            else:
+                canon[node] = by_code[code] = node
+                lines.append(f'    {names[node]} = {code}')
+
+    if wrt is None:
+        lines.append(f'    return {names[exp]}')
+    else:
+        wrt = list(wrt)
+
+        # Only backprop into nodes that lead to one of the expressions in wrt
+        targets = {canon.get(target, target) for target in wrt}
+        needs_grad = set()
+        for node in reversed(order):
+            if canon[node] is node and (node in targets or any(canon[sub] in needs_grad for sub in node._subexps)):
+                needs_grad.add(node)
+
+        # Backward pass, parents before children, through the reused nodes only
+        adjoints = {canon[exp]: 'g0'}
+        lines.append('    g0 = 1')
+        for node in order:
+            if node not in needs_grad or isinstance(node, Variable):
+                continue
+            adj = adjoints[node]
+            args = [names[sub] for sub in node._subexps]
+            for sub, deriv in zip(node._subexps, node._deriv_code(gen, names[node], *args)):
+                sub = canon[sub]
+                if sub not in needs_grad:
+                    continue
+                term = adj if deriv == '1' else f'{adj} * ({deriv})'
+                if sub in adjoints:
+                    # Not +=, as an adjoint can be another name for the same numpy array as an earlier adjoint
+                    lines.append(f'    {adjoints[sub]} = {adjoints[sub]} + {term}')
+                else:
+                    adjoints[sub] = f'g{len(adjoints)}'
+                    lines.append(f'    {adjoints[sub]} = {term}')
+
+        partials = [adjoints.get(canon.get(target, target), '0') for target in wrt]
+        lines.append(f"    return {names[exp]}, [{', '.join(partials)}]")
+
+    source = '\n'.join(lines) + '\n'
+    exec(builtins.compile(source, '<compiled expression>', 'exec'), gen.namespace)
+    compiled = gen.namespace['compiled']
+    compiled.source = source
+    return compiled
@@ -0,0 +1,99 @@
+import threading
+from collections import Counter
+from typing import Any, Optional
+from .graph import Graph
+
+
+class EvaluationContext:
+    """
+    Holds all the state made while evaluating the expressions of one graph: variable assignments, cached values,
+    cached derivatives and the bookkeeping for incremental re-evaluation. The state lives in lists indexed by node id.
+
+    The expressions themselves are never written to while evaluating, so several threads can evaluate the same graph at
+    once as long as each uses its own context. A context is activated for the current thread with a "with" block.
+    Outside of one, every thread shares the default context of the graph.
+
+    Each node records the epoch it was last verified in, and the epoch its value last changed in. Every assignment bumps
+    the epoch, which invalidates every cached value at once. A stale node whose subexpressions have not changed since it
+    was last verified keeps its value, so only the dirty subgraph is recomputed.
+    """
+
+    _local = threading.local()
+    # Number of contexts active in any thread, so the thread local lookup can be skipped when there are none
+    _active_count = 0
+    _count_lock = threading.Lock()
+
+    def __init__(self, graph: Optional[Graph] = None):
+        self.graph = Graph.current() if graph is None else graph
+        self.epoch = 0
+        self.values: list[Any] = []
+        self.assigned: list[bool] = []
+        self.verified_at: list[int] = []
+        self.changed_at: list[int] = []
+        self.adjoints: list[Optional[Counter]] = []
+        self.backprop_at: list[int] = []
+        self.partials: list[Optional[list]] = []
+        self.partials_at: list[int] = []
+
+    @classmethod
+    def current(cls, graph: Graph) -> 'EvaluationContext':
+        """
+        Returns the context active in this thread for the given graph
+        """
+        active = getattr(cls._local, 'active', None) if cls._active_count else None
+        if active:
+            stack = active.get(graph)
+            if stack:
+                return stack[-1]
+        if graph._default_context is None:
+            graph._default_context = cls(graph)
+        return graph._default_context
+
+    def __enter__(self) -> 'EvaluationContext':
+        if not hasattr(self._local, 'active'):
+            self._local.active = {}
+        self._local.active.setdefault(self.graph, []).append(self)
+        with self._count_lock:
+            EvaluationContext._active_count += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        stack = self._local.active[self.graph]
+        stack.pop()
+        if not stack:
+            del self._local.active[self.graph]
+        with self._count_lock:
+            EvaluationContext._active_count -= 1
+
+    def reserve(self) -> None:
+        """
+        Makes room for every node made in the graph so far
+        """
+        missing = len(self.graph) - len(self.values)
+        if missing > 0:
+            self.values.extend([None] * missing)
+            self.assigned.extend([False] * missing)
+            self.verified_at.extend([-1] * missing)
+            self.changed_at.extend([0] * missing)
+            self.adjoints.extend([None] * missing)
+            self.backprop_at.extend([-1] * missing)
+            self.partials.extend([None] * missing)
+            self.partials_at.extend([-1] * missing)
+
+    def invalidate(self) -> None:
+        self.epoch += 1
+
+    def adjoint_counter(self, node_id: int) -> Counter:
+        if node_id >= len(self.adjoints):
+            self.reserve()
+        counter = self.adjoints[node_id]
+        if counter is None:
+            counter = self.adjoints[node_id] = Counter()
+        return counter
+
+    def clear(self, node_id: int) -> None:
+        if node_id < len(self.values):
+            self.values[node_id] = None
+            self.verified_at[node_id] = -1
+            self.backprop_at[node_id] = -1
+            self.partials_at[node_id] = -1
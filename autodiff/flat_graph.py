@@ -0,0 +1,271 @@
+import math
+from typing import Any, Iterable, Optional
+import numpy as np
+from .basic_expressions import Expression, Variable, _pow_exponent_deriv
+from .advanced_expressions import _softplus, _stable_logistic, _logsumexp
+from .opcodes import (VARIABLE, ADD, SUM, CONST_ADD, MUL, CONST_MUL, POW, EXP, LOG, LOGISTIC,
+                      LINEAR_COMBINATION, SOFTPLUS, LOG_LOGISTIC, BINARY_CROSS_ENTROPY, CONST_BINARY_CROSS_ENTROPY,
+                      LOGSUMEXP, SUB, NEG, DIV, CONST_SUB, REVERSE_CONST_SUB, CONST_DIV, REVERSE_CONST_DIV,
+                      BINARY_POW, POW_LOG)
+
+
+class FlatGraph:
+    """
+    A scalar expression stored as a struct of arrays instead of one python object per node.
+    Nodes are numbered children before parents. Each node has an opcode, a constant, and a range of child indices into a
+    shared array, and the values and adjoints of the last pass are kept in flat float64 buffers.
+    A pass is a single loop over these arrays, the store takes a few dozen bytes per node, and copying the graph is a
+    copy of its buffers.
+    """
+
+    def __init__(self, exp: Expression, inputs: Iterable[Variable], wrt: Optional[Iterable[Expression]] = None):
+        inputs = list(inputs)
+        # Every node is made after its subexpressions, so ordering by id puts children before parents, and keeps the
+        # node ids sorted for index()
+        order = sorted(exp._topo_order, key=lambda node: node._id)
+        index = {node: idx for idx, node in enumerate(order)}
+        positions = {}
+        for pos, var in enumerate(inputs):
+            if not isinstance(var, Variable):
+                raise TypeError(f'Inputs must be variables, got {var._str}')
+            positions[var] = pos
+
+        input_nodes = [-1] * len(inputs)
+        child_starts = [0]
+        children = []
+        for idx, node in enumerate(order):
+            if node._opcode is None:
+                raise TypeError(f'{type(node).__name__} cannot be flattened')
+            if isinstance(node, Variable):
+                if node not in positions:
+                    raise ValueError(f'Expression depends on variable {node._str} which is not an input')
+                input_nodes[positions[node]] = idx
+            children.extend(index[sub] for sub in node._subexps)
+            child_starts.append(len(children))
+
+        self._ops = np.array([node._opcode for node in order], dtype=np.int8)
+        self._consts = np.array([node._opcode_const() for node in order], dtype=np.float64)
+        self._child_starts = np.array(child_starts, dtype=np.int32)
+        self._children = np.array(children, dtype=np.int32)
+        self._node_ids = np.array([node._id for node in order], dtype=np.int64)
+        self._input_nodes = np.array(input_nodes, dtype=np.int32)
+        self._wrt_nodes = None if wrt is None else np.array([index.get(node, -1) for node in wrt], dtype=np.int32)
+        self.values = np.zeros(len(order))
+        self.adjoints = np.zeros(len(order))
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    def copy(self) -> 'FlatGraph':
+        """
+        Returns an independent copy of the graph and its buffers
+        """
+        copied = FlatGraph.__new__(FlatGraph)
+        for name, val in self.__dict__.items():
+            setattr(copied, name, None if val is None else val.copy())
+        return copied
+
+    def index(self, exp: Expression) -> int:
+        """
+        Returns the position of exp in the arrays of the graph
+        """
+        idx = int(np.searchsorted(self._node_ids, exp._id))
+        if idx == len(self._node_ids) or self._node_ids[idx] != exp._id:
+            raise KeyError(f'{exp._str} is not part of the graph')
+        return idx
+
+    def value_of(self, exp: Expression) -> float:
+        """
+        Returns the value exp had in the last pass
+        """
+        return float(self.values[self.index(exp)])
+
+    def adjoint_of(self, exp: Expression) -> float:
+        """
+        Returns the partial of the output wrt exp found in the last backward pass
+        """
+        return float(self.adjoints[self.index(exp)])
+
+    def value(self, *values: Any) -> float:
+        """
+        Returns the value of the expression for the given values of the inputs, in order
+        """
+        self._forward(values)
+        return float(self.values[-1])
+
+    def grad(self, *values: Any) -> tuple[float, list[float]]:
+        """
+        Returns the value of the expression and its partials wrt each of wrt, for the given values of the inputs
+        """
+        if self._wrt_nodes is None:
+            raise ValueError('No expressions to differentiate with respect to were given')
+        self._forward(values)
+        self._backward()
+        adjs = self.adjoints
+        return float(self.values[-1]), [float(adjs[idx]) if idx >= 0 else 0. for idx in self._wrt_nodes.tolist()]
+
+    def _forward(self, values: tuple) -> None:
+        if len(values) != len(self._input_nodes):
+            raise ValueError(f'Expected {len(self._input_nodes)} inputs but got {len(values)}')
+        # The loops index memoryviews of the arrays, which python reads and writes as fast as lists, without copying them
+        ops = memoryview(self._ops)
+        consts = memoryview(self._consts)
+        starts = memoryview(self._child_starts)
+        children = memoryview(self._children)
+        vals = memoryview(self.values)
+        for idx, val in zip(self._input_nodes.tolist(), values):
+            vals[idx] = float(val)
+
+        for idx, op in enumerate(ops):
+            start = starts[idx]
+            if op == VARIABLE:
+                continue
+            elif op == MUL:
+                vals[idx] = vals[children[start]] * vals[children[start + 1]]
+            elif op == ADD:
+                vals[idx] = vals[children[start]] + vals[children[start + 1]]
+            elif op == CONST_MUL:
+                vals[idx] = vals[children[start]] * consts[idx]
+            elif op == CONST_ADD:
+                vals[idx] = vals[children[start]] + consts[idx]
+            elif op == SUB:
+                vals[idx] = vals[children[start]] - vals[children[start + 1]]
+            elif op == NEG:
+                vals[idx] = -vals[children[start]]
+            elif op == DIV:
+                vals[idx] = vals[children[start]] / vals[children[start + 1]]
+            elif op == CONST_SUB:
+                vals[idx] = vals[children[start]] - consts[idx]
+            elif op == REVERSE_CONST_SUB:
+                vals[idx] = consts[idx] - vals[children[start]]
+            elif op == CONST_DIV:
+                vals[idx] = vals[children[start]] / consts[idx]
+            elif op == REVERSE_CONST_DIV:
+                vals[idx] = consts[idx] / vals[children[start]]
+            elif op == SUM:
+                total = consts[idx]
+                for child in children[start:starts[idx + 1]]:
+                    total += vals[child]
+                vals[idx] = total
+            elif op == POW:
+                vals[idx] = vals[children[start]] ** consts[idx]
+            elif op == BINARY_POW:
+                vals[idx] = math.pow(vals[children[start]], vals[children[start + 1]])
+            elif op == POW_LOG:
+                vals[idx] = _pow_exponent_deriv(vals[children[start + 1]], vals[children[start]])
+            elif op == EXP:
+                vals[idx] = math.exp(vals[children[start]])
+            elif op == LOG:
+                vals[idx] = math.log(vals[children[start]])
+            elif op == LOGISTIC:
+                vals[idx] = 1 / (1 + math.exp(-vals[children[start]]))
+            elif op == SOFTPLUS:
+                vals[idx] = _softplus(vals[children[start]])
+            elif op == LOG_LOGISTIC:
+                vals[idx] = -_softplus(-vals[children[start]])
+            elif op == BINARY_CROSS_ENTROPY:
+                logit = vals[children[start]]
+                vals[idx] = _softplus(logit) - vals[children[start + 1]] * logit
+            elif op == CONST_BINARY_CROSS_ENTROPY:
+                logit = vals[children[start]]
+                vals[idx] = _softplus(logit) - consts[idx] * logit
+            elif op == LOGSUMEXP:
+                vals[idx] = _logsumexp(*(vals[child] for child in children[start:starts[idx + 1]]))
+            elif op == LINEAR_COMBINATION:
+                args = children[start:starts[idx + 1]]
+                n = len(args) // 2
+                total = 0.
+                for weight, inp in zip(args[:n], args[n:]):
+                    total += vals[weight] * vals[inp]
+                vals[idx] = total
+            else:
+                raise ValueError(f'Unknown opcode {op}')
+
+    def _backward(self) -> None:
+        ops = memoryview(self._ops)
+        consts = memoryview(self._consts)
+        starts = memoryview(self._child_starts)
+        children = memoryview(self._children)
+        vals = memoryview(self.values)
+        self.adjoints[:] = 0.
+        adjs = memoryview(self.adjoints)
+        adjs[-1] = 1.
+
+        for idx in range(len(ops) - 1, -1, -1):
+            op = ops[idx]
+            adj = adjs[idx]
+            start = starts[idx]
+            if op == VARIABLE or not adj:
+                continue
+            elif op == MUL:
+                left, right = children[start], children[start + 1]
+                adjs[left] += adj * vals[right]
+                adjs[right] += adj * vals[left]
+            elif op == ADD:
+                adjs[children[start]] += adj
+                adjs[children[start + 1]] += adj
+            elif op == CONST_MUL:
+                adjs[children[start]] += adj * consts[idx]
+            elif op == CONST_ADD:
+                adjs[children[start]] += adj
+            elif op == SUB:
+                adjs[children[start]] += adj
+                adjs[children[start + 1]] -= adj
+            elif op == NEG or op == REVERSE_CONST_SUB:
+                adjs[children[start]] -= adj
+            elif op == DIV:
+                dividend, divisor = children[start], children[start + 1]
+                adjs[dividend] += adj / vals[divisor]
+                adjs[divisor] -= adj * vals[idx] / vals[divisor]
+            elif op == CONST_SUB:
+                adjs[children[start]] += adj
+            elif op == CONST_DIV:
+                adjs[children[start]] += adj / consts[idx]
+            elif op == REVERSE_CONST_DIV:
+                divisor = children[start]
+                adjs[divisor] -= adj * vals[idx] / vals[divisor]
+            elif op == SUM:
+                for child in children[start:starts[idx + 1]]:
+                    adjs[child] += adj
+            elif op == POW:
+                base = children[start]
+                adjs[base] += adj * consts[idx] * vals[base] ** (consts[idx] - 1)
+            elif op == BINARY_POW:
+                base, exponent = children[start], children[start + 1]
+                adjs[base] += adj * vals[exponent] * vals[base] ** (vals[exponent] - 1)
+                if vals[base] > 0:
+                    adjs[exponent] += adj * vals[idx] * math.log(vals[base])
+                elif vals[idx] != 0:
+                    adjs[exponent] += math.nan
+            elif op == POW_LOG:
+                base, power = children[start], children[start + 1]
+                adjs[base] += adj * vals[power] / vals[base]
+                adjs[power] += adj * math.log(vals[base])
+            elif op == EXP:
+                adjs[children[start]] += adj * vals[idx]
+            elif op == LOG:
+                adjs[children[start]] += adj / vals[children[start]]
+            elif op == LOGISTIC:
+                adjs[children[start]] += adj * vals[idx] * (1 - vals[idx])
+            elif op == SOFTPLUS:
+                adjs[children[start]] -= adj * math.expm1(-vals[idx])
+            elif op == LOG_LOGISTIC:
+                adjs[children[start]] -= adj * math.expm1(vals[idx])
+            elif op == BINARY_CROSS_ENTROPY:
+                logit, target = children[start], children[start + 1]
+                adjs[logit] += adj * (_stable_logistic(vals[logit]) - vals[target])
+                adjs[target] -= adj * vals[logit]
+            elif op == CONST_BINARY_CROSS_ENTROPY:
+                logit = children[start]
+                adjs[logit] += adj * (_stable_logistic(vals[logit]) - consts[idx])
+            elif op == LOGSUMEXP:
+                for child in children[start:starts[idx + 1]]:
+                    adjs[child] += adj * math.exp(vals[child] - vals[idx])
+            elif op == LINEAR_COMBINATION:
+                args = children[start:starts[idx + 1]]
+                n = len(args) // 2
+                for weight, inp in zip(args[:n], args[n:]):
+                    adjs[weight] += adj * vals[inp]
+                    adjs[inp] += adj * vals[weight]
+            else:
+                raise ValueError(f'Unknown opcode {op}')
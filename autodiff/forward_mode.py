@@ -0,0 +1,41 @@
+from typing import Any, Iterable
+import numpy as np
+from .basic_expressions import Expression
+
+
+def jvp(exp: Expression, tangents: dict[Expression, Any]) -> tuple[Any, Any]:
+    """
+    Forward mode autodiff: pushes the tangents of the given expressions (usually variables) up through exp.
+    A tangent can be a number or a numpy vector holding K directions, which are all pushed in the same sweep.
+    Expressions missing from tangents are treated as having a zero tangent.
+    Returns the value of exp and its tangent.
+    """
+    # Tangent of each node, None if the node does not depend on any of the seeded expressions
+    dots: dict[Expression, Any] = {}
+    for node in reversed(exp._topo_order):
+        if node in tangents:
+            dots[node] = tangents[node]
+            continue
+        dot = None
+        for idx, sub in enumerate(node._subexps):
+            sub_dot = dots[sub]
+            if sub_dot is None:
+                continue
+            term = node._local_deriv(idx) * sub_dot
+            dot = term if dot is None else dot + term
+        dots[node] = dot
+
+    dot = dots[exp]
+    if dot is None:
+        dot = 0 * next(iter(tangents.values())) if tangents else 0
+    return exp.val, dot
+
+
+def forward_grad(exp: Expression, variables: Iterable[Expression]) -> np.ndarray:
+    """
+    Finds the partials of exp with respect to every expression in variables using a single batched forward sweep
+    """
+    variables = list(variables)
+    directions = np.eye(len(variables))
+    _, dot = jvp(exp, {var: direction for var, direction in zip(variables, directions)})
+    return np.broadcast_to(dot, (len(variables),)).astype(float)
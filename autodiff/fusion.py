@@ -0,0 +1,127 @@
+from collections import Counter
+from typing import Any, Callable, Optional
+from .basic_expressions import (Expression, Variable, AdditionExpression, SumExpression, ConstantAdditionExpression,
+                                MultiplicationExpression, ConstantMultiplicationExpression, PowerExpression,
+                                ExponentialExpression, LogExpression, NegationExpression,
+                                ReverseConstantDivisionExpression, _is_const, _make_sum)
+from .advanced_expressions import LogisticExpression, SoftplusExpression, LogLogisticExpression, LinearCombinationExpression
+from .simplify import simplify
+
+
+def _logistic_arg(denom: Expression) -> Optional[Expression]:
+    # x if denom is 1 + exp(-x)
+    if not (isinstance(denom, ConstantAdditionExpression) and _is_const(denom._const, 1)
+            and isinstance(denom.exp_term, ExponentialExpression)):
+        return None
+    exponent = denom.exp_term.exponent
+    if isinstance(exponent, NegationExpression):
+        return exponent.arg
+    if isinstance(exponent, ConstantMultiplicationExpression) and _is_const(exponent._const, -1):
+        return exponent.exp_factor
+    return None
+
+
+def _fuse_logistic(node: Expression, uses: Callable) -> Optional[Expression]:
+    # 1 / (1 + exp(-x)) or (1 + exp(-x)) ** -1
+    if isinstance(node, ReverseConstantDivisionExpression) and _is_const(node._const, 1):
+        arg = _logistic_arg(node.divisor)
+    elif isinstance(node, PowerExpression) and _is_const(node._pow, -1):
+        arg = _logistic_arg(node.base)
+    else:
+        return None
+    return None if arg is None else LogisticExpression(arg)
+
+
+def _fuse_softplus(node: LogExpression, uses: Callable) -> Optional[Expression]:
+    # ln(1 + exp(x))
+    arg = node.arg
+    if isinstance(arg, ConstantAdditionExpression) and _is_const(arg._const, 1) and isinstance(arg.exp_term, ExponentialExpression):
+        return SoftplusExpression(arg.exp_term.exponent)
+    return None
+
+
+def _fuse_log_logistic(node: LogExpression, uses: Callable) -> Optional[Expression]:
+    # ln(logistic(x))
+    if isinstance(node.arg, LogisticExpression):
+        return LogLogisticExpression(node.arg.arg)
+    return None
+
+
+def _fuse_square(node: MultiplicationExpression, uses: Callable) -> Optional[Expression]:
+    # x * x
+    if node.left_factor is node.right_factor:
+        return PowerExpression(node.left_factor, 2)
+    return None
+
+
+def _fuse_sum(node: Expression, uses: Callable) -> Optional[Expression]:
+    # Trees of additions become one SumExpression, with the products in it gathered into one LinearCombinationExpression
+    # Only nodes used nowhere else are merged, so nothing is computed twice
+    if isinstance(node, ConstantAdditionExpression):
+        terms, const = [node.exp_term], node._const
+    elif isinstance(node, SumExpression):
+        terms, const = list(node._subexps), node._const
+    else:
+        terms, const = list(node._subexps), 0
+
+    merged = False
+    flat = []
+    while terms:
+        term = terms.pop()
+        if isinstance(term, (AdditionExpression, SumExpression, ConstantAdditionExpression)) and uses(term) == 1:
+            merged = True
+            terms.extend(term._subexps)
+            const += getattr(term, '_const', 0)
+        else:
+            flat.append(term)
+    flat.reverse()
+
+    products = [term for term in flat if isinstance(term, MultiplicationExpression) and uses(term) == 1]
+    if len(products) > 1:
+        flat = [term for term in flat if term not in products]
+        flat.append(LinearCombinationExpression([term.left_factor for term in products],
+                                                [term.right_factor for term in products]))
+    elif not merged:
+        return None
+    if len(flat) == 1 and _is_const(const, 0):
+        return flat[0]
+    return _make_sum(flat, const)
+
+
+_RULES: dict[type, list[Callable]] = {
+    PowerExpression: [_fuse_logistic],
+    ReverseConstantDivisionExpression: [_fuse_logistic],
+    LogExpression: [_fuse_softplus, _fuse_log_logistic],
+    MultiplicationExpression: [_fuse_square],
+    AdditionExpression: [_fuse_sum],
+    SumExpression: [_fuse_sum],
+    ConstantAdditionExpression: [_fuse_sum],
+}
+
+
+def fuse(exp: Expression) -> Any:
+    """
+    Returns an equivalent expression with common composite shapes replaced by single fused nodes:
+    1 / (1 + exp(-x)) becomes logistic(x), ln(1 + exp(x)) becomes softplus(x), ln(logistic(x)) becomes log_logistic(x),
+    x * x becomes x ** 2, and sums of terms and products become a single SumExpression and LinearCombinationExpression.
+    The expression is simplified first.
+    """
+    exp = simplify(exp)
+    if not isinstance(exp, Expression):
+        return exp
+
+    # Number of distinct nodes using each node
+    order = exp._topo_order
+    parents = Counter(sub for node in order for sub in set(node._subexps))
+    fused = {}
+    uses = Counter()
+    for node in reversed(order):
+        new = node if isinstance(node, Variable) else node._rebuild(*(fused[sub] for sub in node._subexps))
+        for rule in _RULES.get(type(new), ()):
+            replacement = rule(new, uses.__getitem__)
+            if replacement is not None:
+                new = replacement
+                break
+        fused[node] = new
+        uses[new] += parents[node]
+    return fused[exp]
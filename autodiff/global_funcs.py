@@ -1,50 +1,115 @@
 import math
-from typing import Any
-from .basic_expressions import Expression, Variable, ExponentialExpression, LogExpression
-from .advanced_expressions import LogisticExpression
+from typing import Any, Iterable, Sequence
+import numpy as np
+from .graph import Graph
+from .basic_expressions import Expression, SumExpression, ExponentialExpression, LogExpression
+from .advanced_expressions import (LogisticExpression, SoftplusExpression, LogLogisticExpression, BinaryCrossEntropyExpression,
+                                   ConstantTargetBinaryCrossEntropyExpression, LinearCombinationExpression, LogSumExpExpression,
+                                   _softplus, _logsumexp)
+from .tensor_expressions import (TensorExpression, TensorExponentialExpression, TensorLogExpression, TensorSoftplusExpression,
+                                 TensorLogLogisticExpression, TensorBinaryCrossEntropyExpression,
+                                 TensorConstantTargetBinaryCrossEntropyExpression)
+from .symbolic import derivative
 
 
 class AssignmentContext:
     def __init__(self, assignments: dict[str, Any]):
-        self._assignments = assignments
+        # Names are resolved in the graph that is current when the assignment is made
+        graph = Graph.current()
+        self._assignments = {graph.get_by_name(name): val for name, val in assignments.items()}
 
     def __enter__(self):
-        for name, val in self._assignments.items():
-            Variable.get_by_name(name).val = val
+        for var, val in self._assignments.items():
+            var.val = val
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        for name in self._assignments:
-            Variable.get_by_name(name).unset()
+        for var in self._assignments:
+            var.unset()
 
 
 class DerivativeView:
     def __init__(self, num: Expression, denom: Expression):
         self._num = num
         self._denom = denom
+        self._expression = None
 
     @property
     def val(self):
+        if not isinstance(self._num, Expression):
+            return 0
         self._num._backprop()
         return self._denom._d[self._num]
 
-
-def d(num, denom) -> DerivativeView:
+    @property
+    def expression(self):
+        """
+        The derivative as an expression, built once and cached
+        """
+        if self._expression is None:
+            self._expression = derivative(self._num, self._denom) if isinstance(self._num, Expression) else 0
+        return self._expression
+
+
+def d(num, denom, symbolic: bool = False):
+    """
+    The derivative of num wrt denom. By default this is a view which is read as a number with value().
+    With symbolic=True it is returned as an expression instead. num can itself be a derivative, so d(d(y, x), x) is
+    the second derivative.
+    """
+    if isinstance(num, DerivativeView):
+        num = num.expression
+    if symbolic:
+        return derivative(num, denom) if isinstance(num, Expression) else 0
     return DerivativeView(num, denom)
 
 
+def grad(exp: Expression, variables: Iterable[Expression], out: str = 'list'):
+    """
+    Finds the partials of exp with respect to every expression in variables using one backprop.
+    out picks the container: 'list', 'dict' (keyed by expression) or 'array' (numpy array).
+    """
+    if out not in ('list', 'dict', 'array'):
+        raise ValueError(f'Unknown output type {out}')
+    variables = list(variables)
+    exp._backprop()
+    partials = [var._d[exp] for var in variables]
+    if out == 'dict':
+        return dict(zip(variables, partials))
+    if out == 'array':
+        return np.array(partials, dtype=float)
+    return partials
+
+
 def assign(**kwargs):
     return AssignmentContext(kwargs)
 
 
+def reassign(**kwargs):
+    """
+    Changes the values of already assigned variables. Only the expressions depending on them are recomputed.
+    """
+    graph = Graph.current()
+    for name, val in kwargs.items():
+        graph.get_by_name(name).update(val)
+
+
 def value(exp: Expression | DerivativeView):
-    return exp.val
+    return exp.val if isinstance(exp, (Expression, DerivativeView)) else exp
 
 
 def exp(exponent):
+    if isinstance(exponent, TensorExpression):
+        return TensorExponentialExpression(exponent)
+    if isinstance(exponent, np.ndarray):
+        return np.exp(exponent)
     return ExponentialExpression(exponent) if isinstance(exponent, Expression) else math.exp(exponent)
 
 
 def ln(arg):
+    if isinstance(arg, TensorExpression):
+        return TensorLogExpression(arg)
+    if isinstance(arg, np.ndarray):
+        return np.log(arg)
     return LogExpression(arg) if isinstance(arg, Expression) else math.log(arg)
 
 
@@ -53,4 +118,117 @@ def log(arg, base=None):
 
 
 def logistic(arg):
+    if isinstance(arg, (TensorExpression, np.ndarray)):
+        return 1 / (1 + exp(-arg))
     return LogisticExpression(arg) if isinstance(arg, Expression) else 1 / (1 + math.exp(-arg))
+
+
+def softplus(arg):
+    """
+    ln(1 + exp(arg)) as a single node that does not overflow
+    """
+    if isinstance(arg, TensorExpression):
+        return TensorSoftplusExpression(arg)
+    if isinstance(arg, np.ndarray):
+        return np.logaddexp(0, arg)
+    return SoftplusExpression(arg) if isinstance(arg, Expression) else _softplus(arg)
+
+
+def log_logistic(arg):
+    """
+    ln(logistic(arg)) as a single node that does not overflow
+    """
+    if isinstance(arg, TensorExpression):
+        return TensorLogLogisticExpression(arg)
+    if isinstance(arg, np.ndarray):
+        return -np.logaddexp(0, -arg)
+    return LogLogisticExpression(arg) if isinstance(arg, Expression) else -_softplus(-arg)
+
+
+def binary_cross_entropy_with_logits(logit, target):
+    """
+    Negative log likelihood of target under logistic(logit), as a single node that does not overflow
+    """
+    if isinstance(logit, TensorExpression) or isinstance(target, TensorExpression):
+        if not isinstance(logit, Expression):
+            return np.logaddexp(0, logit) - target * logit
+        if isinstance(target, Expression):
+            return TensorBinaryCrossEntropyExpression(logit, target)
+        return TensorConstantTargetBinaryCrossEntropyExpression(logit, target)
+    if isinstance(logit, np.ndarray):
+        return np.logaddexp(0, logit) - target * logit
+    if not isinstance(logit, Expression):
+        return _softplus(logit) - target * logit
+    if isinstance(target, Expression):
+        return BinaryCrossEntropyExpression(logit, target)
+    return ConstantTargetBinaryCrossEntropyExpression(logit, target)
+
+
+def sum(terms: Iterable, start=0):
+    """
+    Sums terms into a single SumExpression node instead of a chain of additions.
+    Returns a plain number if none of the terms are expressions.
+    """
+    exps = []
+    const = start
+    for term in terms:
+        if isinstance(term, Expression):
+            exps.append(term)
+        else:
+            const += term
+    return SumExpression(*exps, const_term=const) if exps else const
+
+
+def logsumexp(*terms, axis=None):
+    """
+    ln(exp(x_1) + ... + exp(x_n)) as a single node, computed without overflowing.
+    Given a single tensor expression or array, reduces it over axis instead.
+    """
+    if len(terms) == 1 and isinstance(terms[0], TensorExpression):
+        return terms[0].logsumexp(axis=axis)
+    if len(terms) == 1 and isinstance(terms[0], np.ndarray):
+        shift = np.max(terms[0], axis=axis, keepdims=True)
+        total = np.log(np.sum(np.exp(terms[0] - shift), axis=axis, keepdims=True)) + shift
+        return np.squeeze(total, axis=axis)
+    if not terms:
+        raise ValueError('Cannot take the logsumexp of no terms')
+    if all(isinstance(term, Expression) for term in terms):
+        return LogSumExpExpression(*terms)
+    if any(isinstance(term, Expression) for term in terms):
+        raise TypeError('The terms of logsumexp must be all expressions or all numbers')
+    return _logsumexp(*terms)
+
+
+def softmax(*terms, axis=-1):
+    """
+    Returns exp(x_i) / (exp(x_1) + ... + exp(x_n)) for each term, as exp(x_i - logsumexp) sharing one logsumexp node.
+    Given a single tensor expression or array, normalises it along axis instead.
+    """
+    if len(terms) == 1 and isinstance(terms[0], TensorExpression):
+        return terms[0].softmax(axis=axis)
+    if len(terms) == 1 and isinstance(terms[0], np.ndarray):
+        exps = np.exp(terms[0] - np.max(terms[0], axis=axis, keepdims=True))
+        return exps / np.sum(exps, axis=axis, keepdims=True)
+    total = logsumexp(*terms)
+    return [exp(term - total) for term in terms]
+
+
+def mean(terms: Iterable):
+    terms = list(terms)
+    if not terms:
+        raise ValueError('Cannot take the mean of no terms')
+    return sum(terms) * (1 / len(terms))
+
+
+def dot(weights: Sequence, inputs: Sequence):
+    """
+    Dot product of weights and inputs
+    If every weight and input is an expression, a single LinearCombinationExpression node is made
+    """
+    weights = list(weights)
+    inputs = list(inputs)
+    if len(weights) != len(inputs):
+        raise ValueError(f'Got {len(weights)} weights but {len(inputs)} inputs')
+    if all(isinstance(term, Expression) for term in weights + inputs):
+        return LinearCombinationExpression(weights, inputs)
+    return sum(weight * inp for weight, inp in zip(weights, inputs))
@@ -0,0 +1,92 @@
+import threading
+import weakref
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .basic_expressions import Expression, Variable
+    from .context import EvaluationContext
+
+
+class Graph:
+    """
+    A scope owning a set of variables and all the expressions built from them.
+    Variable names only need to be unique within a graph, and dropping every reference to a graph and its expressions
+    lets the whole model be garbage collected.
+    Variables are made in the graph given to them, or else the graph of the innermost active "with graph:" block, or
+    else the default graph. Other expressions belong to the graph of their subexpressions.
+    With intern=True, building a node with the same type, subexpressions and constants as a live node of the graph
+    returns that node, so repeated subexpressions are only evaluated and backpropagated once.
+    """
+
+    _local = threading.local()
+    _default: 'Graph'
+
+    def __init__(self, intern: bool = False):
+        self._vars: dict[str, 'Variable'] = {}
+        self._node_count = 0
+        self._lock = threading.Lock()
+        self._default_context: Optional['EvaluationContext'] = None
+        # Weak so that interning does not keep otherwise unused nodes alive
+        self._interned: Optional[weakref.WeakValueDictionary] = weakref.WeakValueDictionary() if intern else None
+
+    def __getstate__(self) -> dict:
+        # Evaluation state belongs to the process using the graph, so only the structure is pickled
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_default_context'] = None
+        state['_interned'] = self.interning
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._interned = weakref.WeakValueDictionary() if state['_interned'] else None
+
+    @classmethod
+    def current(cls) -> 'Graph':
+        stack = getattr(cls._local, 'stack', None)
+        return stack[-1] if stack else cls._default
+
+    def __enter__(self) -> 'Graph':
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        self._local.stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._local.stack.pop()
+
+    def __len__(self) -> int:
+        return self._node_count
+
+    @property
+    def interning(self) -> bool:
+        return self._interned is not None
+
+    @property
+    def variables(self) -> list['Variable']:
+        return list(self._vars.values())
+
+    def get_by_name(self, name: str) -> 'Variable':
+        if name not in self._vars:
+            raise KeyError(f'No Variable called {name} exists')
+        return self._vars[name]
+
+    def _add_node(self, node: 'Expression') -> int:
+        # Nodes are numbered in creation order, so every node has a higher id than its subexpressions
+        with self._lock:
+            node_id = self._node_count
+            self._node_count += 1
+        return node_id
+
+    def _add_variable(self, var: 'Variable', name: str) -> None:
+        if name in self._vars:
+            raise ValueError(f'Variable with name {name} already exists')
+        self._vars[name] = var
+
+
+Graph._default = Graph()
+
+
+def default_graph() -> Graph:
+    return Graph._default
@@ -0,0 +1,26 @@
+# Opcodes identifying the kind of each node in a FlatGraph
+VARIABLE = 0
+ADD = 1
+SUM = 2
+CONST_ADD = 3
+MUL = 4
+CONST_MUL = 5
+POW = 6
+EXP = 7
+LOG = 8
+LOGISTIC = 9
+LINEAR_COMBINATION = 10
+SOFTPLUS = 11
+LOG_LOGISTIC = 12
+BINARY_CROSS_ENTROPY = 13
+CONST_BINARY_CROSS_ENTROPY = 14
+LOGSUMEXP = 15
+SUB = 16
+NEG = 17
+DIV = 18
+CONST_SUB = 19
+REVERSE_CONST_SUB = 20
+CONST_DIV = 21
+REVERSE_CONST_DIV = 22
+BINARY_POW = 23
+POW_LOG = 24
@@ -0,0 +1,92 @@
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, Optional, Sequence
+import numpy as np
+from .basic_expressions import Expression, Variable
+from .binding import Binding
+from .global_funcs import grad
+
+# Set in each worker process by _init_worker
+_worker_state: Optional[tuple[Expression, list[Expression], Binding]] = None
+
+
+def _dump_graph(exp: Expression, inputs: list[Variable], wrt: list[Expression]) -> bytes:
+    # Pickling the nodes leaves first means every subexpression is already memoised when its parent is pickled, so
+    # deep graphs don't hit the recursion limit
+    return pickle.dumps((list(reversed(exp._topo_order)), exp, inputs, wrt))
+
+
+def _init_worker(payload: bytes) -> None:
+    global _worker_state
+    _, exp, inputs, wrt = pickle.loads(payload)
+    _worker_state = exp, wrt, Binding(inputs)
+
+
+def _shard_grad(rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    exp, wrt, binding = _worker_state
+    vals = np.empty(len(rows))
+    total = np.zeros(len(wrt))
+    with binding.assign(rows[0]):
+        for i, row in enumerate(rows):
+            if i:
+                binding.update(row)
+            vals[i] = exp.val
+            total += grad(exp, wrt, out='array')
+    return vals, total
+
+
+class ParallelGradient:
+    """
+    Finds the gradient of a scalar expression summed over a batch of samples, using a pool of worker processes.
+    The graph is pickled once and rebuilt in every worker. Each batch is split into one shard per worker, each worker
+    backprops through its samples one at a time, and the per shard gradients are summed here.
+    Inputs are given like for BatchEvaluator: a column with one entry per sample, or a single value shared by every sample.
+    """
+
+    def __init__(self, exp: Expression, inputs: Iterable[Variable], wrt: Iterable[Expression],
+                 processes: Optional[int] = None, mp_context=None):
+        self._inputs = list(inputs)
+        self._wrt = list(wrt)
+        self._processes = processes or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(self._processes, mp_context=mp_context, initializer=_init_worker,
+                                         initargs=(_dump_graph(exp, self._inputs, self._wrt),))
+
+    def __enter__(self) -> 'ParallelGradient':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self._pool.shutdown()
+
+    def _rows(self, values: Sequence[Any]) -> np.ndarray:
+        if len(values) != len(self._inputs):
+            raise ValueError(f'Expected {len(self._inputs)} inputs but got {len(values)}')
+        columns = [np.asarray(val, dtype=float) for val in values]
+        for var, col in zip(self._inputs, columns):
+            if col.ndim > 1:
+                raise ValueError(f'Input for {var._str} must be a scalar or a column, got shape {col.shape}')
+        sizes = {len(col) for col in columns if col.ndim == 1}
+        if len(sizes) > 1:
+            raise ValueError(f'Inputs have different numbers of samples: {sorted(sizes)}')
+        if not sizes:
+            raise ValueError('At least one input must be a column')
+        batch_size = sizes.pop()
+        return np.column_stack([np.broadcast_to(col, (batch_size,)) for col in columns])
+
+    def grad(self, *values: Any, reduce: str = 'sum') -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the value of the expression for every sample, and the partials wrt each of wrt summed or averaged over the batch
+        """
+        if reduce not in ('sum', 'mean'):
+            raise ValueError(f'Unknown reduction {reduce}')
+        rows = self._rows(values)
+        shards = [shard for shard in np.array_split(rows, self._processes) if len(shard)]
+        results = list(self._pool.map(_shard_grad, shards))
+        vals = np.concatenate([shard_vals for shard_vals, _ in results])
+        total = np.sum([shard_total for _, shard_total in results], axis=0)
+        if reduce == 'mean':
+            total /= len(rows)
+        return vals, total
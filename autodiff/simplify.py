@@ -0,0 +1,30 @@
+from typing import Any
+from .basic_expressions import Expression, Variable
+
+
+def simplify(exp: Expression) -> Any:
+    """
+    Returns an equivalent expression with identities removed, constants folded, chained constant operations merged and
+    inverse functions cancelled. The result is a plain number if exp does not depend on any variable.
+    exp itself is left unchanged, and unchanged subexpressions are shared with the result.
+    A few rewrites give a value where the original raises or is nan. Cancelling exp(ln(x)) to x works for x <= 0.
+    Folding e * 0 to 0 and e ** 0 to 1 drops e entirely, so e.g. ln(x) * 0 is 0 even for x <= 0, and an infinite or nan
+    e no longer makes the result nan.
+    """
+    simplified = {}
+    done = set()
+    for node in reversed(exp._topo_order):
+        if isinstance(node, Variable):
+            new = node
+        else:
+            new = node._simplify(*(simplified[sub] for sub in node._subexps))
+            # Nodes made by a rule can often be simplified further
+            while isinstance(new, Expression) and new not in done:
+                further = new._simplify(*new._subexps)
+                if further is new:
+                    break
+                new = further
+        simplified[node] = new
+        if isinstance(new, Expression):
+            done.add(new)
+    return simplified[exp]
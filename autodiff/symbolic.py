@@ -0,0 +1,64 @@
+from typing import Any, Iterable
+from .basic_expressions import Expression, _is_const, _make_sum
+from .simplify import simplify
+
+
+def _scale(adjoint: Any, local: Any) -> Any:
+    # adjoint * local, without making nodes for multiplications by 0, 1 or -1
+    if _is_const(local, 0) or _is_const(adjoint, 0):
+        return 0
+    if _is_const(local, 1):
+        return adjoint
+    if _is_const(adjoint, 1):
+        return local
+    if _is_const(local, -1):
+        return -adjoint
+    return adjoint * local
+
+
+def _total(terms: list) -> Any:
+    const = 0
+    exps = []
+    for term in terms:
+        if isinstance(term, Expression):
+            exps.append(term)
+        else:
+            const += term
+    if not exps:
+        return const
+    if len(exps) == 1:
+        return exps[0] + const if not _is_const(const, 0) else exps[0]
+    return _make_sum(exps, const)
+
+
+def symbolic_grad(exp: Expression, variables: Iterable[Expression]) -> list:
+    """
+    Finds the partials of exp with respect to every expression in variables as new expressions instead of numbers.
+    The partials are built by running backprop over the graph of exp with expressions in place of values, using the
+    derivative rule of each node, and are then simplified. A partial which does not depend on any variable is a number.
+    The results are ordinary expressions, so they can be evaluated, compiled, simplified or differentiated again.
+    Custom nodes need a _deriv_exps method giving their derivatives as expressions, otherwise NotImplementedError is raised.
+    """
+    variables = list(variables)
+    contributions = {exp: [1]}
+    adjoints = {}
+    for node in exp._topo_order:
+        terms = contributions.pop(node, None)
+        if terms is None:
+            continue
+        adjoint = adjoints[node] = _total(terms)
+        if _is_const(adjoint, 0):
+            continue
+        for sub, local in zip(node._subexps, node._deriv_exps()):
+            term = _scale(adjoint, local)
+            if not _is_const(term, 0):
+                contributions.setdefault(sub, []).append(term)
+    return [simplify(adj) if isinstance(adj, Expression) else adj
+            for adj in (adjoints.get(var, 0) for var in variables)]
+
+
+def derivative(num: Expression, denom: Expression) -> Any:
+    """
+    Returns the partial of num wrt denom as an expression, or a number if it is constant
+    """
+    return symbolic_grad(num, [denom])[0]
@@ -0,0 +1,531 @@
+from typing import Any, Optional, Union
+import math
+import numpy as np
+from .basic_expressions import Expression, Argument, Variable, LogExpression
+
+
+def _unbroadcast(grad, shape: tuple[int, ...]):
+    """
+    Sums grad over the axes that were broadcast to get from shape to the shape of grad
+    """
+    if np.shape(grad) == shape:
+        return grad
+    extra = np.ndim(grad) - len(shape)
+    if extra > 0:
+        grad = np.sum(grad, axis=tuple(range(extra)))
+    axes = tuple(axis for axis, size in enumerate(shape) if size == 1 and np.shape(grad)[axis] != 1)
+    if axes:
+        grad = np.sum(grad, axis=axes, keepdims=True)
+    return np.broadcast_to(grad, shape) if shape else float(grad)
+
+
+def _logistic(x):
+    # 1 / (1 + exp(-x)) elementwise, without overflowing for large negative x
+    return 0.5 + 0.5 * np.tanh(x / 2)
+
+
+class TensorExpression(Expression):
+    """
+    Base class for expressions whose value is a numpy array
+    Arithmetic broadcasts like numpy, and the gradients are summed back down to the shape of each argument
+    """
+
+    __slots__ = ()
+
+    # Make numpy defer to the reflected operators below instead of broadcasting over the expression object
+    __array_ufunc__ = None
+    _is_tensor = True
+    _opcode = None
+
+    def __add__(self, other: Any) -> Union['TensorAdditionExpression', 'TensorConstantAdditionExpression']:
+        return TensorAdditionExpression(self, other) if isinstance(other, Expression) else TensorConstantAdditionExpression(self, other)
+
+    __radd__ = __add__
+
+    def __mul__(self, other: Any) -> Union['TensorMultiplicationExpression', 'TensorConstantMultiplicationExpression']:
+        return TensorMultiplicationExpression(self, other) if isinstance(other, Expression) else TensorConstantMultiplicationExpression(self, other)
+
+    __rmul__ = __mul__
+
+    def __pow__(self, power, modulo=None) -> Union['TensorPowerExpression', 'TensorExponentialExpression']:
+        if modulo is not None:
+            raise NotImplementedError('Modular exponentiation is not implemented')
+        return TensorExponentialExpression(TensorLogExpression(self) * power) if isinstance(power, Expression) else TensorPowerExpression(self, power)
+
+    def __rpow__(self, other):
+        log_base = LogExpression(other) if isinstance(other, Expression) else math.log(other)
+        return TensorExponentialExpression(log_base * self)
+
+    # Tensor subtraction and division are lowered to addition, multiplication and powers
+    def __sub__(self, other: Any) -> 'TensorExpression':
+        return self + -1 * other
+
+    def __rsub__(self, other: Any) -> 'TensorExpression':
+        return other + -1 * self
+
+    def __truediv__(self, other: Any) -> 'TensorExpression':
+        return self * (other ** -1 if isinstance(other, Expression) else 1 / np.asarray(other, dtype=float))
+
+    def __rtruediv__(self, other: Any) -> 'TensorExpression':
+        return other * self ** -1
+
+    def __neg__(self) -> 'TensorExpression':
+        return -1 * self
+
+    def __matmul__(self, other: Expression) -> 'MatMulExpression':
+        if not isinstance(other, Expression):
+            return NotImplemented
+        return MatMulExpression(self, other)
+
+    def __rmatmul__(self, other: Expression) -> 'MatMulExpression':
+        if not isinstance(other, Expression):
+            return NotImplemented
+        return MatMulExpression(other, self)
+
+    @property
+    def T(self) -> 'TransposeExpression':
+        return TransposeExpression(self)
+
+    def sum(self, axis: Optional[Union[int, tuple[int, ...]]] = None, keepdims: bool = False) -> 'TensorSumExpression':
+        return TensorSumExpression(self, axis=axis, keepdims=keepdims)
+
+    def mean(self, axis: Optional[Union[int, tuple[int, ...]]] = None, keepdims: bool = False) -> 'TensorMeanExpression':
+        return TensorMeanExpression(self, axis=axis, keepdims=keepdims)
+
+    def logsumexp(self, axis: Optional[Union[int, tuple[int, ...]]] = None, keepdims: bool = False) -> 'TensorLogSumExpExpression':
+        return TensorLogSumExpExpression(self, axis=axis, keepdims=keepdims)
+
+    def softmax(self, axis: int = -1) -> 'TensorSoftmaxExpression':
+        return TensorSoftmaxExpression(self, axis)
+
+    def _unit_adjoint(self):
+        return np.ones_like(self.val, dtype=float)
+
+    def _deriv(self, numer: Expression) -> None:
+        adjoint = self._d[numer]
+        for idx, expr in enumerate(self._subexps):
+            vjp = self._vjps[idx]
+            contrib = vjp(self, adjoint) if vjp is not None else adjoint * self._local_deriv(idx)
+            expr._d[numer] += _unbroadcast(contrib, np.shape(expr.val))
+
+    def _local_deriv(self, idx: int):
+        if self._derivs[idx] is None:
+            raise NotImplementedError(f'{type(self).__name__} only has a vector-Jacobian product for argument {idx}')
+        return super()._local_deriv(idx)
+
+
+class TensorVariable(TensorExpression, Variable):
+    """
+    A variable whose value is a numpy array
+    """
+
+    __slots__ = ()
+
+    def set(self, v):
+        super().set(np.asarray(v, dtype=float))
+
+
+class TensorAdditionExpression(TensorExpression):
+    __slots__ = ()
+    left_term = Argument()
+    right_term = Argument()
+
+    def _get_value(self):
+        return self.left_term.val + self.right_term.val
+
+    @left_term.derivative
+    @right_term.derivative
+    def deriv(self):
+        return 1
+
+    def _make_str(self) -> str:
+        return f'({self.left_term._str} + {self.right_term._str})'
+
+    def _build(self, left, right):
+        return left + right
+
+
+class TensorConstantAdditionExpression(TensorExpression):
+    __slots__ = ('_const',)
+    exp_term = Argument()
+
+    def __init__(self, exp_term: Expression, const_term: Any):
+        super().__init__(exp_term)
+        self._const = const_term
+
+    def _get_value(self):
+        return self.exp_term.val + self._const
+
+    @exp_term.derivative
+    def deriv(self):
+        return 1
+
+    def _make_str(self) -> str:
+        return f'({self.exp_term._str} + {self._const})'
+
+    def _build(self, exp_term):
+        return exp_term + self._const
+
+
+class TensorMultiplicationExpression(TensorExpression):
+    __slots__ = ()
+    left_factor = Argument()
+    right_factor = Argument()
+
+    def _get_value(self):
+        return self.left_factor.val * self.right_factor.val
+
+    @left_factor.derivative
+    def left_deriv(self):
+        return self.right_factor.val
+
+    @right_factor.derivative
+    def right_deriv(self):
+        return self.left_factor.val
+
+    def _make_str(self) -> str:
+        return f'({self.left_factor._str} * {self.right_factor._str})'
+
+    def _build(self, left, right):
+        return left * right
+
+
+class TensorConstantMultiplicationExpression(TensorExpression):
+    __slots__ = ('_const',)
+    exp_factor = Argument()
+
+    def __init__(self, exp_factor: Expression, const_factor: Any):
+        super().__init__(exp_factor)
+        self._const = const_factor
+
+    def _get_value(self):
+        return self.exp_factor.val * self._const
+
+    @exp_factor.derivative
+    def derivative(self):
+        return self._const
+
+    def _make_str(self) -> str:
+        return f'({self._const} * {self.exp_factor._str})'
+
+    def _build(self, exp_factor):
+        return exp_factor * self._const
+
+
+class TensorPowerExpression(TensorExpression):
+    __slots__ = ('_pow',)
+    base = Argument()
+
+    def __init__(self, base: Expression, power: Any):
+        super().__init__(base)
+        self._pow = power
+
+    def _get_value(self):
+        return self.base.val ** self._pow
+
+    @base.derivative
+    def derivative(self):
+        return self._pow * self.base.val ** (self._pow - 1)
+
+    def _make_str(self) -> str:
+        return f'({self.base._str} ** {self._pow})'
+
+    def _build(self, base):
+        return base ** self._pow
+
+
+class TensorExponentialExpression(TensorExpression):
+    __slots__ = ()
+    exponent = Argument()
+
+    def _get_value(self):
+        return np.exp(self.exponent.val)
+
+    @exponent.derivative
+    def derivative(self):
+        return self.val
+
+    def _make_str(self) -> str:
+        return f"exp({self.exponent._str})"
+
+    def _build(self, exponent):
+        return TensorExponentialExpression(exponent)
+
+
+class TensorLogExpression(TensorExpression):
+    __slots__ = ()
+    arg = Argument()
+
+    def _get_value(self):
+        return np.log(self.arg.val)
+
+    @arg.derivative
+    def derivative(self):
+        return 1 / self.arg.val
+
+    def _make_str(self) -> str:
+        return f"ln({self.arg._str})"
+
+    def _build(self, arg):
+        return TensorLogExpression(arg)
+
+
+class TensorSoftplusExpression(TensorExpression):
+    """
+    ln(1 + exp(x)) elementwise, computed with logaddexp so that it does not overflow
+    """
+
+    __slots__ = ()
+    arg = Argument()
+
+    def _get_value(self):
+        return np.logaddexp(0, self.arg.val)
+
+    @arg.derivative
+    def derivative(self):
+        return _logistic(self.arg.val)
+
+    def _make_str(self) -> str:
+        return f"softplus({self.arg._str})"
+
+    def _build(self, arg):
+        return TensorSoftplusExpression(arg)
+
+
+class TensorLogLogisticExpression(TensorExpression):
+    """
+    ln(logistic(x)) elementwise, computed as -ln(1 + exp(-x)) with logaddexp so that it does not overflow
+    """
+
+    __slots__ = ()
+    arg = Argument()
+
+    def _get_value(self):
+        return -np.logaddexp(0, -self.arg.val)
+
+    @arg.derivative
+    def derivative(self):
+        return _logistic(-self.arg.val)
+
+    def _make_str(self) -> str:
+        return f"log_logistic({self.arg._str})"
+
+    def _build(self, arg):
+        return TensorLogLogisticExpression(arg)
+
+
+class TensorBinaryCrossEntropyExpression(TensorExpression):
+    """
+    Elementwise negative log likelihood of target under logistic(logit), computed with logaddexp so that it does not
+    overflow
+    """
+
+    __slots__ = ()
+    logit = Argument()
+    target = Argument()
+
+    def _get_value(self):
+        logit = self.logit.val
+        return np.logaddexp(0, logit) - self.target.val * logit
+
+    @logit.derivative
+    def logit_deriv(self):
+        return _logistic(self.logit.val) - self.target.val
+
+    @target.derivative
+    def target_deriv(self):
+        return -self.logit.val
+
+    def _make_str(self) -> str:
+        return f'bce({self.logit._str}, {self.target._str})'
+
+    def _build(self, logit, target):
+        return TensorBinaryCrossEntropyExpression(logit, target)
+
+
+class TensorConstantTargetBinaryCrossEntropyExpression(TensorExpression):
+    """
+    TensorBinaryCrossEntropyExpression with a constant target
+    """
+
+    __slots__ = ('_target',)
+    logit = Argument()
+
+    def __init__(self, logit: Expression, target: Any):
+        super().__init__(logit)
+        self._target = target
+
+    def _get_value(self):
+        logit = self.logit.val
+        return np.logaddexp(0, logit) - self._target * logit
+
+    @logit.derivative
+    def derivative(self):
+        return _logistic(self.logit.val) - self._target
+
+    def _make_str(self) -> str:
+        return f'bce({self.logit._str}, {self._target})'
+
+    def _build(self, logit):
+        return TensorConstantTargetBinaryCrossEntropyExpression(logit, self._target)
+
+
+class MatMulExpression(TensorExpression):
+    __slots__ = ()
+    left_factor = Argument()
+    right_factor = Argument()
+
+    def _get_value(self):
+        return self.left_factor.val @ self.right_factor.val
+
+    def _promoted(self, grad):
+        # Treat 1d factors as matrices like np.matmul does, and give the gradient the matching shape
+        left = np.asarray(self.left_factor.val)
+        right = np.asarray(self.right_factor.val)
+        if left.ndim == 1:
+            left = left[np.newaxis, :]
+            grad = np.expand_dims(grad, -2)
+        if right.ndim == 1:
+            right = right[:, np.newaxis]
+            grad = np.expand_dims(grad, -1)
+        return left, right, grad
+
+    @left_factor.vjp
+    def left_vjp(self, grad):
+        left, right, grad = self._promoted(grad)
+        result = grad @ np.swapaxes(right, -1, -2)
+        return result[..., 0, :] if np.ndim(self.left_factor.val) == 1 else result
+
+    @right_factor.vjp
+    def right_vjp(self, grad):
+        left, right, grad = self._promoted(grad)
+        result = np.swapaxes(left, -1, -2) @ grad
+        return result[..., 0] if np.ndim(self.right_factor.val) == 1 else result
+
+    def _make_str(self) -> str:
+        return f'({self.left_factor._str} @ {self.right_factor._str})'
+
+    def _build(self, left, right):
+        return MatMulExpression(left, right)
+
+
+class TransposeExpression(TensorExpression):
+    __slots__ = ('_axes',)
+    arg = Argument()
+
+    def __init__(self, arg: Expression, axes: Optional[tuple[int, ...]] = None):
+        super().__init__(arg)
+        self._axes = axes
+
+    def _get_value(self):
+        return np.transpose(self.arg.val, self._axes)
+
+    @arg.vjp
+    def vjp(self, grad):
+        return np.transpose(grad, None if self._axes is None else np.argsort(self._axes))
+
+    def _make_str(self) -> str:
+        return f'transpose({self.arg._str})' if self._axes is None else f'transpose({self.arg._str}, {self._axes})'
+
+    def _build(self, arg):
+        return TransposeExpression(arg, self._axes)
+
+
+class TensorSumExpression(TensorExpression):
+    __slots__ = ('_axis', '_keepdims')
+    arg = Argument()
+
+    def __init__(self, arg: Expression, axis: Optional[Union[int, tuple[int, ...]]] = None, keepdims: bool = False):
+        super().__init__(arg)
+        self._axis = axis
+        self._keepdims = keepdims
+
+    def _get_value(self):
+        return np.sum(self.arg.val, axis=self._axis, keepdims=self._keepdims)
+
+    def _expand(self, grad):
+        # Broadcast the gradient of the reduced value back to the shape of the argument
+        shape = np.shape(self.arg.val)
+        if self._axis is not None and not self._keepdims:
+            grad = np.expand_dims(grad, self._axis)
+        return np.broadcast_to(grad, shape)
+
+    @arg.vjp
+    def vjp(self, grad):
+        return self._expand(grad)
+
+    def _make_str(self) -> str:
+        return f'sum({self.arg._str})' if self._axis is None else f'sum({self.arg._str}, axis={self._axis})'
+
+    def _build(self, arg):
+        return type(self)(arg, axis=self._axis, keepdims=self._keepdims)
+
+
+class TensorMeanExpression(TensorSumExpression):
+    __slots__ = ()
+    arg = Argument()
+
+    def _get_value(self):
+        return np.mean(self.arg.val, axis=self._axis, keepdims=self._keepdims)
+
+    @arg.vjp
+    def vjp(self, grad):
+        count = np.size(self.arg.val) // max(np.size(self.val), 1)
+        return self._expand(grad) / count
+
+    def _make_str(self) -> str:
+        return f'mean({self.arg._str})' if self._axis is None else f'mean({self.arg._str}, axis={self._axis})'
+
+
+class TensorLogSumExpExpression(TensorSumExpression):
+    """
+    ln(sum(exp(x))) over the given axes, computed with the largest entry shifted out so that nothing overflows
+    """
+
+    __slots__ = ()
+    arg = Argument()
+
+    def _get_value(self):
+        x = self.arg.val
+        shift = np.max(x, axis=self._axis, keepdims=True)
+        shift = np.where(np.isfinite(shift), shift, 0)
+        total = np.log(np.sum(np.exp(x - shift), axis=self._axis, keepdims=True)) + shift
+        return total if self._keepdims else np.squeeze(total, axis=self._axis)
+
+    @arg.vjp
+    def vjp(self, grad):
+        # Each entry gets its softmax weight
+        return self._expand(grad) * np.exp(self.arg.val - self._expand(self.val))
+
+    def _make_str(self) -> str:
+        return f'logsumexp({self.arg._str})' if self._axis is None else f'logsumexp({self.arg._str}, axis={self._axis})'
+
+
+class TensorSoftmaxExpression(TensorExpression):
+    """
+    exp(x) normalised to sum to 1 along an axis, computed with the largest entry shifted out
+    """
+
+    __slots__ = ('_axis',)
+    arg = Argument()
+
+    def __init__(self, arg: Expression, axis: int = -1):
+        super().__init__(arg)
+        self._axis = axis
+
+    def _get_value(self):
+        x = self.arg.val
+        exps = np.exp(x - np.max(x, axis=self._axis, keepdims=True))
+        return exps / np.sum(exps, axis=self._axis, keepdims=True)
+
+    @arg.vjp
+    def vjp(self, grad):
+        # The Jacobian is diag(s) - s s^T, so its product with grad only needs one reduction
+        probs = self.val
+        return probs * (grad - np.sum(grad * probs, axis=self._axis, keepdims=True))
+
+    def _make_str(self) -> str:
+        return f'softmax({self.arg._str}, axis={self._axis})'
+
+    def _build(self, arg):
+        return TensorSoftmaxExpression(arg, self._axis)
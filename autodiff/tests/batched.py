@@ -0,0 +1,128 @@
+import pickle
+import unittest
+from unittest import mock
+from autodiff import *
+import numpy as np
+
+
+class TestBatched(unittest.TestCase):
+
+    def setUp(self):
+        # Every test builds its variables in its own graph
+        self.enterContext(Graph())
+
+    def test_batch_value(self):
+        x = Variable('bx1')
+        w = Variable('bw1')
+        y = logistic(w * x) + ln(x)
+        xs = np.array([0.5, 1, 2])
+        vals = batch_value(y, {x: xs, w: 3})
+        for x_val, val in zip(xs, vals):
+            with assign(bx1=x_val, bw1=3):
+                self.assertAlmostEqual(val, value(y))
+
+    def test_batch_grad_matches_loop(self):
+        xs = [Variable(f'bx{i}') for i in range(2, 5)]
+        ws = [Variable(f'bw{i}') for i in range(2, 5)]
+        t = Variable('bt1')
+        p = logistic(dot(ws, xs))
+        ll = t * ln(p) + (1 - t) * ln(1 - p)
+        rng = np.random.default_rng(0)
+        data = rng.normal(size=(10, 3))
+        targets = np.array([0, 1] * 5)
+        weights = [0.5, -0.25, 1]
+        evaluator = BatchEvaluator(ll, xs + ws + [t], wrt=ws)
+        vals, partials = evaluator.grad(*data.T, *weights, targets, reduce='mean')
+
+        expected = np.zeros(3)
+        for row, target, val in zip(data, targets, vals):
+            assignments = {f'bx{i}': x for i, x in zip(range(2, 5), row)} | {f'bw{i}': w for i, w in zip(range(2, 5), weights)}
+            with assign(bt1=target, **assignments):
+                self.assertAlmostEqual(val, value(ll))
+                expected += grad(ll, ws, out='array')
+        for actual, exp_val in zip(partials, expected / 10):
+            self.assertAlmostEqual(actual, exp_val)
+
+    def test_batch_grad_of_shared_term(self):
+        x = Variable('bx5')
+        w = Variable('bw5')
+        y = w * 2 + x
+        _, partials = batch_grad(y, [w, x], {x: [1, 2, 3, 4], w: 1})
+        self.assertEqual(partials.tolist(), [8, 4])
+
+    def test_batch_grad_of_aliased_adjoints(self):
+        # The sum passes its adjoint on unchanged, so x gets a second contribution added to an adjoint shared with y
+        x = Variable('bx5b')
+        y = Variable('by5b')
+        z = logistic(x + y + x)
+        xs = np.array([0.5, -1., 2.])
+        ys = np.array([0.25, 0.75, -0.5])
+        _, partials = batch_grad(z, [x, y], {x: xs, y: ys})
+        expected = np.zeros(2)
+        for x_val, y_val in zip(xs, ys):
+            with assign(bx5b=x_val, by5b=y_val):
+                expected += grad(z, [x, y])
+        np.testing.assert_allclose(partials, expected)
+
+    def test_batch_binary_power_without_np_pow(self):
+        # np.pow only exists from numpy 2
+        x = Variable('bx5c')
+        y = Variable('by5c')
+        with mock.patch.dict(np.__dict__):
+            np.__dict__.pop('pow', None)
+            vals = batch_value(x ** y, {x: [2., 3.], y: 2})
+        np.testing.assert_allclose(vals, [4, 9])
+
+    def test_mismatched_batch_sizes(self):
+        x = Variable('bx6')
+        y = Variable('by1')
+        with self.assertRaises(ValueError):
+            batch_value(x + y, {x: [1, 2], y: [1, 2, 3]})
+
+    def test_pickled_graph(self):
+        x = Variable('bx7')
+        w = Variable('bw6')
+        y = logistic(w * x) + x ** 2
+        with assign(bx7=2, bw6=0.5):
+            expected = grad(y, [x, w])
+        _, y2 = pickle.loads(pickle.dumps((list(reversed(y._topo_order)), y)))
+        graph = y2._graph
+        self.assertIsNot(graph, y._graph)
+        with graph, assign(bx7=2, bw6=0.5):
+            self.assertEqual(grad(y2, [graph.get_by_name('bx7'), graph.get_by_name('bw6')]), expected)
+
+    def test_parallel_grad_matches_loop(self):
+        xs = [Variable(f'bx{i}') for i in range(8, 11)]
+        ws = [Variable(f'bw{i}') for i in range(7, 10)]
+        t = Variable('bt2')
+        p = logistic(dot(ws, xs))
+        ll = t * ln(p) + (1 - t) * ln(1 - p)
+        rng = np.random.default_rng(1)
+        data = rng.normal(size=(9, 3))
+        targets = np.array([0, 1, 1] * 3)
+        weights = [0.5, -0.25, 1]
+        with ParallelGradient(ll, xs + ws + [t], ws, processes=2) as parallel:
+            vals, partials = parallel.grad(*data.T, *weights, targets, reduce='mean')
+        expected_vals, expected = BatchEvaluator(ll, xs + ws + [t], ws).grad(*data.T, *weights, targets, reduce='mean')
+        np.testing.assert_allclose(vals, expected_vals)
+        np.testing.assert_allclose(partials, expected)
+
+    def test_batch_binary_cross_entropy(self):
+        z = Variable('bz1')
+        t = Variable('bt3')
+        loss = binary_cross_entropy_with_logits(z, t) + log_logistic(z)
+        logits = np.array([-1000., -1, 0, 2, 1000])
+        targets = np.array([1., 0, 1, 0, 0])
+        vals, partials = batch_grad(loss, [z], {z: logits, t: targets})
+        expected_vals = []
+        expected_partial = 0
+        for logit, target in zip(logits, targets):
+            with assign(bz1=logit, bt3=target):
+                expected_vals.append(value(loss))
+                expected_partial += value(d(loss, z))
+        np.testing.assert_allclose(vals, expected_vals)
+        np.testing.assert_allclose(partials, [expected_partial])
+
+
+if __name__ == '__main__':
+    unittest.main()
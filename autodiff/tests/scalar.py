@@ -1,10 +1,57 @@
+import gc
+import threading
 import unittest
+import weakref
 from autodiff import *
 import math
+import numpy as np
+
+
+class CountingExpression(Expression):
+    """
+    Identity expression which counts how many times its value is computed
+    """
+    arg = Argument()
+
+    def __init__(self, arg):
+        super().__init__(arg)
+        self.evaluations = 0
+
+    def _get_value(self):
+        self.evaluations += 1
+        return self.arg.val
+
+    @arg.derivative
+    def derivative(self):
+        return 1
+
+    def _make_str(self) -> str:
+        return f'count({self.arg._str})'
+
+
+class Sigmoid(Expression):
+    """
+    Custom node declared like the one in the demo notebook
+    """
+    arg = Argument()
+
+    def _get_value(self):
+        return 1 / (1 + math.exp(-self.arg.val))
+
+    @arg.derivative
+    def derivative(self):
+        return self.val * (1 - self.val)
+
+    def _make_str(self) -> str:
+        return f'sigmoid({self.arg._str})'
 
 
 class TestAutodiff(unittest.TestCase):
 
+    def setUp(self):
+        # Every test builds its variables in its own graph
+        self.enterContext(Graph())
+
     def test_value(self):
         x = Variable('x1')
         with assign(x1=1):
@@ -76,6 +123,15 @@ class TestAutodiff(unittest.TestCase):
             self.assertAlmostEqual(value(dzdx), 4)
             self.assertAlmostEqual(value(dzdy), 3)
 
+    def test_repeated_child_deriv(self):
+        a = Variable('a_rep')
+        s = a + 1
+        y = s * s
+        z = a + a
+        with assign(a_rep=2):
+            self.assertAlmostEqual(value(d(y, a)), 6)
+            self.assertAlmostEqual(value(d(z, a)), 2)
+
     def test_power_value(self):
         x = Variable('x11')
         sq = x**2
@@ -358,6 +414,701 @@ class TestAutodiff(unittest.TestCase):
         with assign(x47=math.log(3)):
             self.assertAlmostEqual(value(dydx), 3/16)
 
+    def test_topo_order_reused(self):
+        x = Variable('x48')
+        y = Variable('y18')
+        z = x * y + x
+        dzdx = d(z, x)
+        with assign(x48=2, y18=3):
+            self.assertAlmostEqual(value(dzdx), 4)
+        order = z._topo_order
+        with assign(x48=5, y18=7):
+            self.assertAlmostEqual(value(dzdx), 8)
+        self.assertIs(z._topo_order, order)
+
+    def test_grad_list(self):
+        x = Variable('x49')
+        y = Variable('y19')
+        z = x**2 * y
+        with assign(x49=3, y19=2):
+            dzdx, dzdy = grad(z, [x, y])
+            self.assertAlmostEqual(dzdx, 12)
+            self.assertAlmostEqual(dzdy, 9)
+
+    def test_grad_dict_and_array(self):
+        x = Variable('x50')
+        y = Variable('y20')
+        z = x * y + y
+        with assign(x50=3, y20=2):
+            partials = grad(z, [x, y], out='dict')
+            self.assertAlmostEqual(partials[x], 2)
+            self.assertAlmostEqual(partials[y], 4)
+            self.assertEqual(grad(z, [x, y], out='array').tolist(), [2, 4])
+
+    def test_grad_unused_variable(self):
+        x = Variable('x51')
+        y = Variable('y21')
+        z = 2 * x
+        with assign(x51=3, y21=2):
+            self.assertEqual(grad(z, [x, y]), [2, 0])
+
+    def test_jvp(self):
+        x = Variable('x52')
+        y = Variable('y22')
+        z = x**2 * y
+        with assign(x52=3, y22=2):
+            val, dot = jvp(z, {x: 1, y: 0.5})
+            self.assertAlmostEqual(val, 18)
+            self.assertAlmostEqual(dot, 12 + 0.5 * 9)
+
+    def test_jvp_batched(self):
+        x = Variable('x53')
+        y = Variable('y23')
+        z = exp(x) * y
+        with assign(x53=1, y23=2):
+            _, dot = jvp(z, {x: np.array([1, 0, 1]), y: np.array([0, 1, 1])})
+            expected = [2 * math.e, math.e, 3 * math.e]
+            for actual, exp_val in zip(dot, expected):
+                self.assertAlmostEqual(actual, exp_val)
+
+    def test_forward_grad_matches_grad(self):
+        x = Variable('x54')
+        y = Variable('y24')
+        w = Variable('w1')
+        z = logistic(x * y) + ln(y) * w
+        with assign(x54=0.3, y24=2, w1=4):
+            forward = forward_grad(z, [x, y, w])
+            reverse = grad(z, [x, y, w])
+            for f, r in zip(forward, reverse):
+                self.assertAlmostEqual(f, r)
+
+    def test_deep_graph(self):
+        x = Variable('x55')
+        y = x
+        for _ in range(5000):
+            y = (y + x) * 1
+        with assign(x55=2):
+            self.assertAlmostEqual(value(y), 10002)
+            self.assertAlmostEqual(value(d(y, x)), 5001)
+
+    def test_sum_value(self):
+        xs = [Variable(f'xs{i}') for i in range(4)]
+        s = sum(x * i for i, x in enumerate(xs))
+        with assign(xs0=1, xs1=2, xs2=3, xs3=4):
+            self.assertAlmostEqual(value(s), 20)
+
+    def test_sum_deriv(self):
+        x = Variable('x56')
+        y = Variable('y25')
+        s = sum([x, y, x * y, 3])
+        self.assertEqual(len(s._subexps), 3)
+        with assign(x56=2, y25=5):
+            self.assertAlmostEqual(value(s), 20)
+            self.assertEqual(grad(s, [x, y]), [6, 3])
+
+    def test_sum_constants(self):
+        self.assertEqual(sum([1, 2, 3]), 6)
+
+    def test_mean(self):
+        x = Variable('x57')
+        y = Variable('y26')
+        m = mean([x, y, 3])
+        with assign(x57=2, y26=4):
+            self.assertAlmostEqual(value(m), 3)
+            self.assertAlmostEqual(value(d(m, x)), 1/3)
+
+    def test_dot_value(self):
+        ws = [Variable(f'wd{i}') for i in range(3)]
+        xs = [Variable(f'xd{i}') for i in range(3)]
+        lin = dot(ws, xs)
+        with assign(wd0=1, wd1=2, wd2=3, xd0=4, xd1=5, xd2=6):
+            self.assertAlmostEqual(value(lin), 32)
+
+    def test_dot_deriv(self):
+        ws = [Variable(f'wd{i}') for i in range(3, 5)]
+        xs = [Variable(f'xd{i}') for i in range(3, 5)]
+        pred = logistic(dot(ws, xs))
+        with assign(wd3=0.5, wd4=-1, xd3=2, xd4=0.25):
+            s = 1 / (1 + math.exp(-0.75))
+            partials = grad(pred, ws + xs)
+            for actual, expected in zip(partials, [2, 0.25, 0.5, -1]):
+                self.assertAlmostEqual(actual, s * (1 - s) * expected)
+
+    def test_dot_constant_weights(self):
+        x = Variable('x58')
+        y = Variable('y27')
+        lin = dot([2, 3], [x, y])
+        with assign(x58=1, y27=4):
+            self.assertAlmostEqual(value(lin), 14)
+            self.assertEqual(grad(lin, [x, y]), [2, 3])
+
+    def test_compile_value(self):
+        x = Variable('x59')
+        y = Variable('y28')
+        z = ln(x * y + 1) - 3 / y
+        f = compile(z, [x, y])
+        with assign(x59=2, y28=4):
+            self.assertAlmostEqual(f(2, 4), value(z))
+
+    def test_compile_grad(self):
+        x = Variable('x60')
+        y = Variable('y29')
+        w = Variable('w2')
+        z = logistic(dot([x, y], [w, w])) * exp(x) + x ** 2 + sum([x, y, w])
+        f = compile(z, [x, y, w], wrt=[x, y, w])
+        val, partials = f(0.5, -1, 2)
+        with assign(x60=0.5, y29=-1, w2=2):
+            self.assertAlmostEqual(val, value(z))
+            for actual, expected in zip(partials, grad(z, [x, y, w])):
+                self.assertAlmostEqual(actual, expected)
+
+    def test_compile_grad_repeated_child(self):
+        x = Variable('x_rep')
+        s = x + 1
+        z = s * s + (x + x) * s
+        f = compile(z, [x], wrt=[x])
+        val, (partial,) = f(2)
+        with assign(x_rep=2):
+            self.assertAlmostEqual(val, value(z))
+            self.assertAlmostEqual(partial, value(d(z, x)))
+            self.assertAlmostEqual(partial, 16)
+
+    def test_compile_missing_input(self):
+        x = Variable('x61')
+        y = Variable('y30')
+        with self.assertRaises(ValueError):
+            compile(x + y, [x])
+
+    def test_nested_assignment(self):
+        x = Variable('x62')
+        y = Variable('y31')
+        z = x * 2
+        w = z + y
+        dwdx = d(w, x)
+        with assign(x62=1):
+            self.assertAlmostEqual(value(z), 2)
+            with assign(y31=3):
+                self.assertAlmostEqual(value(w), 5)
+                self.assertAlmostEqual(value(dwdx), 2)
+            with self.assertRaises(VariableAssignmentError):
+                value(w)
+            self.assertAlmostEqual(value(z), 2)
+
+    def test_incremental_reassign(self):
+        x = Variable('x63')
+        w = Variable('w3')
+        x_part = CountingExpression(x * 2)
+        w_part = CountingExpression(w ** 2)
+        z = x_part * w_part
+        dzdx = d(z, x)
+        with assign(x63=1, w3=3):
+            self.assertAlmostEqual(value(z), 18)
+            reassign(x63=2)
+            self.assertAlmostEqual(value(z), 36)
+            self.assertAlmostEqual(value(dzdx), 18)
+            reassign(w3=1)
+            self.assertAlmostEqual(value(z), 4)
+            self.assertAlmostEqual(value(dzdx), 2)
+        self.assertEqual(x_part.evaluations, 2)
+        self.assertEqual(w_part.evaluations, 2)
+
+    def test_fixed_weights_not_recomputed(self):
+        x = Variable('x64')
+        w = Variable('w4')
+        w_part = CountingExpression(exp(w))
+        z = w_part * x
+        with assign(w4=0):
+            for x_val in range(3):
+                with assign(x64=x_val):
+                    self.assertAlmostEqual(value(z), x_val)
+                    self.assertAlmostEqual(value(d(z, w)), x_val)
+        with assign(w4=0, x64=5):
+            self.assertAlmostEqual(value(z), 5)
+        self.assertEqual(w_part.evaluations, 1)
+
+    def test_reassign_unassigned_error(self):
+        x = Variable('x65')
+        with self.assertRaises(VariableAssignmentError):
+            reassign(x65=1)
+
+    def test_binding(self):
+        x = Variable('x66')
+        y = Variable('y32')
+        w = Variable('w5')
+        w_part = CountingExpression(w * 2)
+        z = x * y + w_part
+        binding = Binding([x, y, 'w5'])
+        for row in [[1, 2, 3], np.array([4., 5., 3.]), (0, 1, 3)]:
+            with binding.assign(row):
+                self.assertAlmostEqual(value(z), row[0] * row[1] + 6)
+                self.assertEqual(grad(z, [x, y, w]), [row[1], row[0], 2])
+        self.assertEqual(w_part.evaluations, 1)
+        with self.assertRaises(VariableAssignmentError):
+            value(z)
+
+    def test_binding_update(self):
+        x = Variable('x67')
+        y = Variable('y33')
+        binding = Binding([x, y])
+        with binding.assign([1, 2]):
+            binding.update([3, 4])
+            self.assertAlmostEqual(value(x * y), 12)
+            with self.assertRaises(ValueError):
+                binding.update([1, 2, 3])
+
+    def test_binding_after_named_assignment(self):
+        x = Variable('x68')
+        binding = Binding([x])
+        with binding.assign([1]):
+            self.assertAlmostEqual(value(x + 1), 2)
+        with assign(x68=5):
+            self.assertAlmostEqual(value(x + 1), 6)
+        with binding.assign([1]):
+            self.assertAlmostEqual(value(x + 1), 2)
+
+    def test_binding_already_assigned_error(self):
+        x = Variable('x69')
+        binding = Binding([x])
+        with assign(x69=1):
+            with self.assertRaises(VariableAssignmentError):
+                with binding.assign([2]):
+                    pass
+
+    def test_binding_wrong_row_leaves_unassigned(self):
+        x = Variable('x69b')
+        y = Variable('y69b')
+        binding = Binding([x, y])
+        with self.assertRaises(ValueError):
+            with binding.assign([1, 2, 3]):
+                pass
+        with assign(x69b=1, y69b=2):
+            self.assertAlmostEqual(value(x + y), 3)
+
+    def test_reassign_signed_zero(self):
+        x = Variable('x69c')
+        y = Variable('y69c')
+        z = x * 2
+        with assign(x69c=0.):
+            self.assertEqual(math.copysign(1., value(x)), 1)
+            reassign(x69c=-0.)
+            self.assertEqual(math.copysign(1., value(x)), -1)
+            self.assertEqual(math.copysign(1., value(z)), -1)
+        binding = Binding([y])
+        with binding.assign([0.]):
+            binding.update([-0.])
+            self.assertEqual(math.copysign(1., value(y)), -1)
+
+    def test_graphs_share_names(self):
+        with Graph():
+            x = Variable('x')
+            y = x * 2
+            with assign(x=3):
+                self.assertAlmostEqual(value(y), 6)
+        with Graph() as graph:
+            x = Variable('x')
+            y = x + 1
+        with graph:
+            with assign(x=3):
+                self.assertAlmostEqual(value(y), 4)
+        with self.assertRaises(KeyError):
+            Variable.get_by_name('x')
+
+    def test_graph_explicit_variable(self):
+        graph = Graph()
+        x = Variable('x', graph=graph)
+        self.assertIs(graph.get_by_name('x'), x)
+        self.assertEqual(graph.variables, [x])
+        self.assertIs((x ** 2)._graph, graph)
+
+    def test_graphs_cannot_mix(self):
+        x = Variable('x', graph=Graph())
+        y = Variable('y', graph=Graph())
+        with self.assertRaises(ValueError):
+            x + y
+
+    def test_graph_collected(self):
+        with Graph() as graph:
+            x = Variable('x')
+            y = exp(x) * x
+        refs = [weakref.ref(graph), weakref.ref(x), weakref.ref(y)]
+        del graph, x, y
+        gc.collect()
+        self.assertTrue(all(ref() is None for ref in refs))
+
+    def test_evaluation_contexts_are_separate(self):
+        x = Variable('x70')
+        y = x ** 2
+        with assign(x70=2):
+            with EvaluationContext(x._graph):
+                with self.assertRaises(VariableAssignmentError):
+                    value(y)
+                with assign(x70=5):
+                    self.assertAlmostEqual(value(y), 25)
+                    self.assertAlmostEqual(value(d(y, x)), 10)
+            self.assertAlmostEqual(value(y), 4)
+            self.assertAlmostEqual(value(d(y, x)), 4)
+
+    def test_threads_share_graph(self):
+        graph = Graph()
+        x = Variable('x', graph=graph)
+        w = Variable('w', graph=graph)
+        y = logistic(w * x) * x
+        errors = []
+
+        def work(offset):
+            try:
+                with EvaluationContext(graph), graph:
+                    for i in range(200):
+                        x_val = offset + i / 100
+                        with assign(x=x_val, w=0.5):
+                            s = 1 / (1 + math.exp(-0.5 * x_val))
+                            self.assertAlmostEqual(value(y), s * x_val)
+                            self.assertAlmostEqual(value(d(y, w)), s * (1 - s) * x_val ** 2)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(offset,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_nodes_have_no_dict(self):
+        x = Variable('x71')
+        t = TensorVariable('t1')
+        nodes = [x, x + 1, x * x, x * 2, x ** 2, exp(x), ln(x), logistic(x), sum([x, x]), dot([x], [x]), t, t @ t, t.T,
+                 t.sum()]
+        nodes += [x - 1, 1 - x, -x, x / 2, 2 / x, x / (x + 1), x ** x, softplus(x), log_logistic(x),
+                  binary_cross_entropy_with_logits(x, 0.5), logsumexp(x, x * 2)]
+        for node in nodes:
+            self.assertFalse(hasattr(node, '__dict__'), type(node).__name__)
+
+    def test_node_classes_declare_slots(self):
+        # A subclass without __slots__ would give its nodes a __dict__ again
+        classes = [Expression]
+        while classes:
+            cls = classes.pop()
+            if cls.__module__.startswith('autodiff.') and not cls.__module__.startswith('autodiff.tests'):
+                self.assertIn('__slots__', vars(cls), cls.__name__)
+            classes.extend(cls.__subclasses__())
+
+    def test_repeated_subexpression(self):
+        a = Variable('a6')
+        s = a + 1
+        y = s * s
+        self.assertEqual(len(y._topo_order), 3)
+        with assign(a6=2):
+            self.assertEqual(value(d(y, a)), 6)
+            self.assertEqual(compile(y, [a], wrt=[a])(2), (9, [6]))
+
+    def test_flat_graph_grad(self):
+        x = Variable('x72')
+        y = Variable('y32')
+        w = Variable('w3')
+        z = logistic(dot([x, y], [w, w])) * exp(x) + ln(x ** 2 + 1) + sum([x, y, w], start=2) * 3
+        flat = FlatGraph(z, [x, y, w], wrt=[x, y, w])
+        val, partials = flat.grad(0.5, -1, 2)
+        with assign(x72=0.5, y32=-1, w3=2):
+            self.assertAlmostEqual(val, value(z))
+            for actual, expected in zip(partials, grad(z, [x, y, w])):
+                self.assertAlmostEqual(actual, expected)
+            self.assertAlmostEqual(flat.value_of(z), value(z))
+        self.assertAlmostEqual(flat.adjoint_of(w), partials[2])
+
+    def test_flat_graph_copy(self):
+        x = Variable('x73')
+        flat = FlatGraph(x * x + 1, [x])
+        self.assertEqual(flat.value(3), 10)
+        copied = flat.copy()
+        self.assertEqual(copied.value(2), 5)
+        self.assertEqual(flat.values[-1], 10)
+        self.assertEqual(copied.value_of(x), 2)
+        self.assertEqual(flat.index(x), 0)
+        with self.assertRaises(KeyError):
+            flat.index(Variable('y73'))
+        with self.assertRaises(TypeError):
+            FlatGraph(TensorVariable('t2').sum(), [])
+
+    def test_interning(self):
+        with Graph(intern=True):
+            x = Variable('x')
+            y = Variable('y')
+            self.assertIs(x - y, x - y)
+            self.assertIs(log(x, 2) * log(y, 2), log(x, 2) * log(y, 2))
+            self.assertIs(dot([x, y], [y, x]), dot([x, y], [y, x]))
+            self.assertIsNot(x * 2, x * 2.)
+            self.assertIsNot(x + y, y + x)
+            self.assertIsNot(x * 0., x * -0.)
+            self.assertIs(x * -0., x * -0.)
+            self.assertIs(x * math.nan, x * math.nan)
+            z = ln(x * y) + ln(x * y)
+            self.assertEqual(len(z._topo_order), 5)
+            with assign(x=2, y=3):
+                self.assertAlmostEqual(value(d(z, x)), 1)
+        x = Variable('x74')
+        self.assertIsNot(x + 1, x + 1)
+
+    def test_compile_reuses_repeated_subexpressions(self):
+        x = Variable('x75')
+        y = Variable('y33')
+        z = logistic(x * y + 0.5) * logistic(x * y + 0.5)
+        f = compile(z, [x, y], wrt=[x, y])
+        self.assertEqual(f.source.count('math.exp'), 1)
+        val, partials = f(1, 2)
+        with assign(x75=1, y33=2):
+            self.assertAlmostEqual(val, value(z))
+            for actual, expected in zip(partials, grad(z, [x, y])):
+                self.assertAlmostEqual(actual, expected)
+
+    def test_simplify(self):
+        x = Variable('x76')
+        y = Variable('y34')
+        self.assertIs(simplify(x ** 1), x)
+        self.assertIs(simplify(ln(exp(x))), x)
+        self.assertIs(simplify(exp(ln(x))), x)
+        self.assertIs(simplify(-(-x)), x)
+        self.assertIs(simplify(x * 2 * 0.5 + 0), x)
+        self.assertEqual(simplify(x ** 0 * 3), 3)
+        self.assertIs(simplify(y * x ** 0), y)
+        chain = simplify(((x + 1) + 2) * 2 * 3)
+        self.assertEqual(len(chain._topo_order), 3)
+        self.assertEqual(simplify((x ** 2) ** 3)._pow, 6)
+        # Folding these would give a value where the original raises
+        self.assertIsInstance(simplify((x ** 0.5) ** 2).base, type(x ** 0.5))
+        self.assertIsInstance(simplify((x ** -1) ** -1).base, type(x ** -1))
+
+    def test_simplify_custom_nodes(self):
+        x = Variable('x76b')
+        rebuilt = simplify(Sigmoid(x * 1) + 0)
+        self.assertIsInstance(rebuilt, Sigmoid)
+        self.assertIs(rebuilt.arg, x)
+        kept = Sigmoid(CountingExpression(x * 1) * 1)
+        # CountingExpression takes its own constructor arguments, so it is kept with its unsimplified subexpression
+        self.assertIs(simplify(kept).arg, kept.arg.exp_factor)
+        self.assertIs(simplify(Sigmoid(x * 0)).arg.exp_factor, x)
+        fused = fuse(Sigmoid(x * x))
+        self.assertIsInstance(fused.arg, type(x ** 2))
+        with assign(x76b=0.5):
+            self.assertAlmostEqual(value(rebuilt), value(Sigmoid(x)))
+            self.assertAlmostEqual(value(fused), value(Sigmoid(x * x)))
+
+    def test_simplify_keeps_value_and_derivs(self):
+        x = Variable('x77')
+        y = Variable('y35')
+        z = sum([ln(exp(x * y)) + 1, (x ** 2) ** 3, -(-(y ** 1)) * 1, exp(ln(x)) + 0]) - 4
+        simple = simplify(z)
+        self.assertLess(len(simple._topo_order), len(z._topo_order))
+        with assign(x77=1.5, y35=-2):
+            self.assertAlmostEqual(value(simple), value(z))
+            for actual, expected in zip(grad(simple, [x, y]), grad(z, [x, y])):
+                self.assertAlmostEqual(actual, expected)
+
+    def test_fuse_patterns(self):
+        x = Variable('x78')
+        y = Variable('y36')
+        self.assertIsInstance(fuse(1 / (1 + exp(-x))), type(logistic(x)))
+        self.assertIsInstance(fuse(ln(1 + exp(x))), type(softplus(x)))
+        square = fuse(x * x)
+        self.assertIs(square.base, x)
+        self.assertEqual(square._pow, 2)
+        self.assertEqual(len(fuse(x * y + y * x + x + 1)._topo_order), 4)
+
+    def test_fuse_keeps_value_and_derivs(self):
+        ws = [Variable(f'w{i}') for i in range(4, 7)]
+        xs = [Variable(f'x{i}') for i in range(79, 82)]
+        t = Variable('t3')
+        linear = ws[0] * xs[0] + ws[1] * xs[1] + ws[2] * xs[2]
+        p = 1 / (1 + exp(-linear))
+        ll = t * ln(p) + (1 - t) * ln(1 - p) + ln(1 + exp(linear)) * (xs[0] * xs[0])
+        fused = fuse(ll)
+        self.assertLess(len(fused._topo_order), len(ll._topo_order))
+        with assign(w4=0.5, w5=-1, w6=2, x79=1, x80=0.5, x81=-0.25, t3=1):
+            self.assertAlmostEqual(value(fused), value(ll))
+            for actual, expected in zip(grad(fused, ws + xs), grad(ll, ws + xs)):
+                self.assertAlmostEqual(actual, expected)
+
+    def test_softplus_is_stable(self):
+        x = Variable('x82')
+        y = softplus(x)
+        with assign(x82=1000):
+            self.assertEqual(value(y), 1000)
+            self.assertEqual(value(d(y, x)), 1)
+        with assign(x82=-1000):
+            self.assertEqual(value(y), 0)
+        f = compile(y, [x], wrt=[x])
+        val, (partial,) = f(2)
+        self.assertAlmostEqual(val, math.log(1 + math.exp(2)))
+        self.assertAlmostEqual(partial, 1 / (1 + math.exp(-2)))
+
+    def test_log_logistic(self):
+        x = Variable('x83')
+        y = log_logistic(x)
+        with assign(x83=0.5):
+            self.assertAlmostEqual(value(y), math.log(1 / (1 + math.exp(-0.5))))
+            self.assertAlmostEqual(value(d(y, x)), 1 / (1 + math.exp(0.5)))
+        with assign(x83=-1000):
+            self.assertEqual(value(y), -1000)
+            self.assertEqual(value(d(y, x)), 1)
+        self.assertIsInstance(fuse(ln(logistic(x))), type(y))
+
+    def test_binary_cross_entropy_with_logits(self):
+        z = Variable('z6')
+        t = Variable('t4')
+        loss = binary_cross_entropy_with_logits(z, t)
+        const_loss = binary_cross_entropy_with_logits(z, 1)
+        p = logistic(z)
+        naive = -(t * ln(p) + (1 - t) * ln(1 - p))
+        with assign(z6=0.75, t4=0.25):
+            self.assertAlmostEqual(value(loss), value(naive))
+            for actual, expected in zip(grad(loss, [z, t]), grad(naive, [z, t])):
+                self.assertAlmostEqual(actual, expected)
+        with assign(z6=-800, t4=1):
+            self.assertEqual(value(loss), 800)
+            self.assertEqual(value(d(loss, z)), -1)
+            self.assertEqual(value(const_loss), 800)
+            self.assertEqual(value(d(const_loss, z)), -1)
+        f = compile(loss + const_loss, [z, t], wrt=[z, t])
+        val, partials = f(-800, 1)
+        self.assertEqual(val, 1600)
+        self.assertEqual(partials, [-2, 800])
+        val, partials = FlatGraph(loss + const_loss, [z, t], wrt=[z, t]).grad(-800, 1)
+        self.assertEqual(val, 1600)
+        self.assertEqual(partials, [-2, 800])
+
+    def test_logsumexp(self):
+        xs = [Variable(f'x{i}') for i in range(84, 87)]
+        y = logsumexp(*xs)
+        vals = [1000, 1001, 999]
+        with assign(x84=vals[0], x85=vals[1], x86=vals[2]):
+            total = math.log(sum(math.exp(v - 1001) for v in vals)) + 1001
+            self.assertAlmostEqual(value(y), total)
+            for actual, val in zip(grad(y, xs), vals):
+                self.assertAlmostEqual(actual, math.exp(val - total))
+        val, partials = compile(y, xs, wrt=xs)(*vals)
+        self.assertAlmostEqual(val, total)
+        self.assertAlmostEqual(partials[1], math.exp(1001 - total))
+
+    def test_softmax(self):
+        xs = [Variable(f'x{i}') for i in range(87, 90)]
+        probs = softmax(*xs)
+        loss = -ln(probs[1])
+        with assign(x87=1, x88=2, x89=3):
+            exps = [math.exp(v) for v in (1, 2, 3)]
+            for prob, e in zip(probs, exps):
+                self.assertAlmostEqual(value(prob), e / sum(exps))
+            # The gradient of cross entropy wrt the logits is the probabilities minus the one hot target
+            for actual, prob, target in zip(grad(loss, xs), probs, [0, 1, 0]):
+                self.assertAlmostEqual(actual, value(prob) - target)
+
+    def test_subtraction_and_division_nodes(self):
+        x = Variable('x90')
+        y = Variable('y37')
+        exps = [x - y, x - 2, 2 - x, -x, x / y, x / 4, 3 / y]
+        self.assertTrue(all(len(e._topo_order) <= 3 for e in exps))
+        z = sum(exps)
+        with assign(x90=1.5, y37=-0.5):
+            self.assertAlmostEqual(value(z), 2 + -0.5 + 0.5 - 1.5 - 3 + 0.375 - 6)
+            dx, dy = grad(z, [x, y])
+            self.assertAlmostEqual(dx, 1 + 1 - 1 - 1 + 1 / -0.5 + 0.25)
+            self.assertAlmostEqual(dy, -1 - 1.5 / 0.25 - 3 / 0.25)
+            self.assertEqual(compile(z, [x, y], wrt=[x, y])(1.5, -0.5), (value(z), [dx, dy]))
+            val, partials = FlatGraph(z, [x, y], wrt=[x, y]).grad(1.5, -0.5)
+            self.assertAlmostEqual(val, value(z))
+            self.assertAlmostEqual(partials[0], dx)
+            self.assertAlmostEqual(partials[1], dy)
+
+    def test_binary_power(self):
+        x = Variable('x91')
+        y = Variable('y38')
+        z = x ** y
+        self.assertEqual(len(z._topo_order), 3)
+        with assign(x91=2, y38=1.5):
+            self.assertAlmostEqual(value(z), 2 ** 1.5)
+            dx, dy = grad(z, [x, y])
+            self.assertAlmostEqual(dx, 1.5 * 2 ** 0.5)
+            self.assertAlmostEqual(dy, 2 ** 1.5 * math.log(2))
+        with assign(x91=-2, y38=3):
+            self.assertEqual(value(z), -8)
+            self.assertEqual(value(d(z, x)), 12)
+            self.assertTrue(math.isnan(value(d(z, y))))
+            self.assertEqual(compile(z, [x, y], wrt=[x])(-2, 3), (-8, [12]))
+        with assign(x91=0, y38=2):
+            self.assertEqual(grad(z, [x, y]), [0, 0])
+        with assign(x91=-2, y38=0.5):
+            with self.assertRaises(ValueError):
+                value(z)
+
+    def test_binary_power_engines_agree(self):
+        x = Variable('x91b')
+        y = Variable('y38b')
+        z = x ** y
+        compiled = compile(z, [x, y], wrt=[x, y])
+        flat = FlatGraph(z, [x, y], wrt=[x, y])
+        for x_val, y_val in [(2, 1.5), (-2, 3), (0, 2), (-2, 0)]:
+            with assign(x91b=x_val, y38b=y_val):
+                expected = value(z), grad(z, [x, y])
+            for val, partials in [compiled(x_val, y_val), flat.grad(x_val, y_val)]:
+                self.assertAlmostEqual(val, expected[0])
+                for actual, partial in zip(partials, expected[1]):
+                    if math.isnan(partial):
+                        self.assertTrue(math.isnan(actual))
+                    else:
+                        self.assertAlmostEqual(actual, partial)
+        with self.assertRaises(ValueError):
+            compile(z, [x, y])(-2, 0.5)
+        batch = BatchEvaluator(z, [x, y], wrt=[y])
+        with np.errstate(invalid='ignore'):
+            _, partials = batch.grad(np.array([2., -2., 0.]), np.array([1.5, 3., 2.]), reduce='sum')
+        self.assertTrue(math.isnan(partials[0]))
+
+    def test_symbolic_derivative(self):
+        x = Variable('x93')
+        y = Variable('y93')
+        f = x ** 3 * y + exp(x * y) + ln(x) / y
+        dx = d(f, x, symbolic=True)
+        self.assertIsInstance(dx, Expression)
+        self.assertEqual(d(x * 2 + y, x, symbolic=True), 2)
+        self.assertEqual(d(d(x * 2, x), x, symbolic=True), 0)
+        with assign(x93=1.5, y93=0.7):
+            self.assertAlmostEqual(value(dx), value(d(f, x)))
+            self.assertAlmostEqual(value(d(d(f, x), x)), 6 * 1.5 * 0.7 + 0.49 * math.exp(1.05) - 1 / (1.5 ** 2 * 0.7))
+            self.assertAlmostEqual(value(d(d(f, x), y)), value(d(d(f, y), x)))
+            self.assertAlmostEqual(value(d(d(x * 2, x), x)), 0)
+        dxx = compile(d(dx, x, symbolic=True), [x, y])
+        self.assertAlmostEqual(dxx(1.5, 0.7), 6 * 1.5 * 0.7 + 0.49 * math.exp(1.05) - 1 / (1.5 ** 2 * 0.7))
+
+    def test_symbolic_grad_matches_backprop(self):
+        x = Variable('x92')
+        y = Variable('y92')
+        z = logistic(x * y) - x / (y + 1) + softplus(x) * log_logistic(y) + logsumexp(x, y) + x ** y
+        partials = symbolic_grad(z, [x, y])
+        with assign(x92=0.8, y92=1.3):
+            for symbolic, numeric in zip(partials, grad(z, [x, y])):
+                self.assertAlmostEqual(value(symbolic), numeric)
+
+    def test_symbolic_binary_power_negative_base(self):
+        x = Variable('x94')
+        y = Variable('y94')
+        z = x ** y
+        dy = d(z, y, symbolic=True)
+        with assign(x94=-2, y94=3):
+            self.assertTrue(math.isnan(value(dy)))
+            self.assertTrue(math.isnan(value(d(z, y))))
+            self.assertEqual(value(d(z, x, symbolic=True)), 12)
+        with assign(x94=0, y94=2):
+            self.assertEqual(value(dy), value(d(z, y)))
+        with assign(x94=2, y94=1.5):
+            self.assertAlmostEqual(value(d(dy, y, symbolic=True)), 2 ** 1.5 * math.log(2) ** 2)
+            self.assertAlmostEqual(value(d(d(z, y), x)), 2 ** 0.5 * (1.5 * math.log(2) + 1))
+        self.assertAlmostEqual(compile(dy, [x, y])(2, 1.5), 2 ** 1.5 * math.log(2))
+        self.assertAlmostEqual(FlatGraph(dy, [x, y]).value(2, 1.5), 2 ** 1.5 * math.log(2))
+
+    def test_symbolic_custom_node_error(self):
+        x = Variable('x95')
+        with self.assertRaisesRegex(NotImplementedError, '_deriv_exps'):
+            d(Sigmoid(x), x, symbolic=True)
+
 
 if __name__ == '__main__':
     unittest.main()
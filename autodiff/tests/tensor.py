@@ -0,0 +1,130 @@
+import math
+import unittest
+from autodiff import *
+import numpy as np
+
+
+class TestTensor(unittest.TestCase):
+
+    def setUp(self):
+        # Every test builds its variables in its own graph
+        self.enterContext(Graph())
+
+    def test_matmul_value(self):
+        w = TensorVariable('tw1')
+        x = TensorVariable('tx1')
+        y = w @ x
+        w_val = np.arange(6).reshape(2, 3)
+        x_val = np.arange(3)
+        with assign(tw1=w_val, tx1=x_val):
+            np.testing.assert_allclose(value(y), w_val @ x_val)
+
+    def test_matmul_deriv(self):
+        w = TensorVariable('tw2')
+        x = TensorVariable('tx2')
+        b = TensorVariable('tb1')
+        loss = ((x @ w + b) ** 2).sum()
+        rng = np.random.default_rng(0)
+        w_val, x_val, b_val = rng.normal(size=(3, 2)), rng.normal(size=(4, 3)), rng.normal(size=2)
+        with assign(tw2=w_val, tx2=x_val, tb1=b_val):
+            residual = 2 * (x_val @ w_val + b_val)
+            np.testing.assert_allclose(value(d(loss, w)), x_val.T @ residual)
+            np.testing.assert_allclose(value(d(loss, x)), residual @ w_val.T)
+            np.testing.assert_allclose(value(d(loss, b)), residual.sum(axis=0))
+
+    def test_matvec_deriv(self):
+        w = TensorVariable('tw3')
+        x = TensorVariable('tx3')
+        y = (w @ x).sum()
+        w_val = np.arange(6.).reshape(2, 3)
+        x_val = np.array([1., -1., 2.])
+        with assign(tw3=w_val, tx3=x_val):
+            np.testing.assert_allclose(value(d(y, w)), np.outer(np.ones(2), x_val))
+            np.testing.assert_allclose(value(d(y, x)), w_val.sum(axis=0))
+
+    def test_scalar_broadcast_deriv(self):
+        s = Variable('ts1')
+        x = TensorVariable('tx4')
+        y = (s * x + 1).mean()
+        with assign(ts1=2, tx4=[1., 2., 3., 6.]):
+            self.assertAlmostEqual(value(y), 7)
+            self.assertAlmostEqual(value(d(y, s)), 3)
+            np.testing.assert_allclose(value(d(y, x)), [0.5] * 4)
+
+    def test_transpose_and_reductions(self):
+        x = TensorVariable('tx5')
+        y = (np.array([1., 2.]) * exp(x.T).sum(axis=1)).sum()
+        x_val = np.array([[0., 1.], [1., 0.], [2., 2.]])
+        with assign(tx5=x_val):
+            self.assertAlmostEqual(value(y), (np.exp(x_val).sum(axis=0) * [1, 2]).sum())
+            np.testing.assert_allclose(value(d(y, x)), np.exp(x_val) * [1, 2])
+
+    def test_log_deriv(self):
+        x = TensorVariable('tx6')
+        y = ln(x).sum(axis=1, keepdims=True).mean()
+        x_val = np.array([[1., 2.], [4., 8.]])
+        with assign(tx6=x_val):
+            np.testing.assert_allclose(value(d(y, x)), 1 / x_val / 2)
+
+    def test_softplus_extremes(self):
+        x = TensorVariable('tx_sp')
+        y = softplus(x).sum()
+        with assign(tx_sp=[1000., -1000., 0.]):
+            self.assertAlmostEqual(value(y), 1000 + math.log(2))
+            np.testing.assert_allclose(value(d(y, x)), [1, 0, 0.5])
+        np.testing.assert_allclose(softplus(np.array([1000., -1000.])), [1000, 0])
+
+    def test_log_logistic_and_bce_extremes(self):
+        x = TensorVariable('tx_ll')
+        t = TensorVariable('tt_ll')
+        y = log_logistic(x).sum()
+        loss = binary_cross_entropy_with_logits(x, t).sum()
+        const_loss = binary_cross_entropy_with_logits(x, np.array([1., 0., 0.5])).sum()
+        with assign(tx_ll=[1000., -1000., 0.], tt_ll=[1., 0., 0.5]):
+            self.assertAlmostEqual(value(y), -1000 - math.log(2))
+            np.testing.assert_allclose(value(d(y, x)), [0, 1, 0.5])
+            self.assertAlmostEqual(value(loss), math.log(2))
+            self.assertAlmostEqual(value(const_loss), math.log(2))
+            np.testing.assert_allclose(value(d(loss, x)), [0, 0, 0])
+            np.testing.assert_allclose(value(d(const_loss, x)), [0, 0, 0])
+            np.testing.assert_allclose(value(d(loss, t)), [-1000, 1000, 0])
+
+    def test_in_place_update(self):
+        w = TensorVariable('tw_inplace')
+        y = (w * w).sum()
+        w_val = np.array([1., 2.])
+        with assign(tw_inplace=w_val):
+            self.assertAlmostEqual(value(y), 5)
+            w_val *= 10
+            w.update(w_val)
+            self.assertAlmostEqual(value(y), 500)
+            np.testing.assert_allclose(value(d(y, w)), [20, 40])
+            w_val /= 10
+            reassign(tw_inplace=w_val)
+            self.assertAlmostEqual(value(y), 5)
+
+    def test_logsumexp(self):
+        x = TensorVariable('tx7')
+        y = (logsumexp(x, axis=1) * np.array([1., 2.])).sum()
+        x_val = np.array([[1000., 1001., 999.], [0., -1., 2.]])
+        with assign(tx7=x_val):
+            shifted = x_val - x_val.max(axis=1, keepdims=True)
+            probs = np.exp(shifted) / np.exp(shifted).sum(axis=1, keepdims=True)
+            totals = np.log(np.exp(shifted).sum(axis=1)) + x_val.max(axis=1)
+            self.assertAlmostEqual(value(y), totals @ [1, 2])
+            np.testing.assert_allclose(value(d(y, x)), probs * [[1], [2]])
+
+    def test_softmax(self):
+        x = TensorVariable('tx8')
+        w = np.array([[1., -2., 0.5], [0., 3., 1.]])
+        y = (softmax(x) * w).sum()
+        x_val = np.array([[0.5, 1., -1.], [2., 0., 1.]])
+        with assign(tx8=x_val):
+            probs = np.exp(x_val) / np.exp(x_val).sum(axis=1, keepdims=True)
+            self.assertAlmostEqual(value(y), (probs * w).sum())
+            expected = probs * (w - (probs * w).sum(axis=1, keepdims=True))
+            np.testing.assert_allclose(value(d(y, x)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+from typing import Any, Iterable, Optional, Sequence
+import numpy as np
+from .basic_expressions import Expression, Variable
+from .compiler import _generate
+
+
+class BatchEvaluator:
+    """
+    Evaluates an expression over a whole batch of samples at once.
+    Each input can be given as a column array with one entry per sample, or as a single value shared by every sample.
+    The graph is compiled once with numpy in place of math, so every node is evaluated by one numpy call per batch.
+    """
+
+    def __init__(self, exp: Expression, inputs: Iterable[Variable], wrt: Optional[Iterable[Expression]] = None):
+        self._inputs = list(inputs)
+        self._wrt = None if wrt is None else list(wrt)
+        self._value_func = _generate(exp, self._inputs, None, np)
+        self._grad_func = None if self._wrt is None else _generate(exp, self._inputs, self._wrt, np)
+
+    def _prepare(self, values: Sequence[Any]) -> tuple[list[Any], int]:
+        if len(values) != len(self._inputs):
+            raise ValueError(f'Expected {len(self._inputs)} inputs but got {len(values)}')
+        batch_size = None
+        prepared = []
+        for var, val in zip(self._inputs, values):
+            val = np.asarray(val, dtype=float)
+            if val.ndim > 1:
+                raise ValueError(f'Input for {var._str} must be a scalar or a column, got shape {val.shape}')
+            if val.ndim == 1:
+                if batch_size is not None and len(val) != batch_size:
+                    raise ValueError(f'Input for {var._str} has {len(val)} samples but expected {batch_size}')
+                batch_size = len(val)
+            prepared.append(val)
+        if batch_size is None:
+            raise ValueError('At least one input must be a column')
+        return prepared, batch_size
+
+    def value(self, *values: Any) -> np.ndarray:
+        """
+        Returns the value of the expression for every sample
+        """
+        prepared, batch_size = self._prepare(values)
+        return np.broadcast_to(self._value_func(*prepared), (batch_size,))
+
+    def grad(self, *values: Any, reduce: str = 'sum') -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the value of the expression for every sample, and the partials wrt each of wrt summed or averaged over the batch
+        """
+        if self._grad_func is None:
+            raise ValueError('No expressions to differentiate with respect to were given')
+        if reduce not in ('sum', 'mean'):
+            raise ValueError(f'Unknown reduction {reduce}')
+        prepared, batch_size = self._prepare(values)
+        val, partials = self._grad_func(*prepared)
+        reduced = np.array([np.broadcast_to(partial, (batch_size,)).sum() for partial in partials])
+        if reduce == 'mean':
+            reduced /= batch_size
+        return np.broadcast_to(val, (batch_size,)), reduced
+
+
+def batch_value(exp: Expression, columns: dict[Variable, Any]) -> np.ndarray:
+    """
+    Evaluates exp once per sample, with the values of the variables given as columns
+    """
+    return BatchEvaluator(exp, columns).value(*columns.values())
+
+
+def batch_grad(exp: Expression, wrt: Iterable[Expression], columns: dict[Variable, Any],
+               reduce: str = 'sum') -> tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluates exp once per sample and finds its partials wrt each of wrt, summed or averaged over the samples
+    """
+    return BatchEvaluator(exp, columns, wrt).grad(*columns.values(), reduce=reduce)